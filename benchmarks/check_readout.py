@@ -0,0 +1,68 @@
+"""
+Checks the fast polysemantic readouts against their references on random-weight stand-ins: FeatureReadout
+against sae.encode, TorchPCA against PCA.transform with and without whitening, and LayerReadout's fallback
+to sklearn when the on-device projection is wrong. Exits 1 on any mismatch.
+
+    python check_readout.py [--d-model 64] [--samples 256]
+"""
+import argparse
+import torch
+import standins
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--d-model", type=int, default=64)
+    parser.add_argument("--d-sae", type=int, default=512)
+    parser.add_argument("--samples", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+def check_feature_readout(readout, args, x):
+    sae = standins.TinySAE(args.d_model, args.d_sae, args.seed)
+    with torch.no_grad():
+        # a non-zero decoder bias, so the input centering is exercised too
+        sae.b_dec.normal_(generator=torch.Generator().manual_seed(args.seed))
+    features = [0, 7, args.d_sae - 1]
+    fast = readout.FeatureReadout(sae, features)
+    expected = sae.encode(x)[..., features]
+    return fast.check(x) and torch.allclose(fast(x), expected, atol=1e-5, rtol=1e-5)
+
+def check_pca(readout, args, x, whiten):
+    from sklearn.decomposition import PCA
+    pca = PCA(n_components=2, whiten=whiten).fit(x.numpy())
+    return readout.pca_matches(pca, readout.TorchPCA(pca, standins.CPU), x, atol=1e-4)
+
+def check_pca_fallback(readout, args, x):
+    """A LayerReadout whose TorchPCA is corrupted must serve pca.transform instead."""
+    from sklearn.decomposition import PCA
+    pca = PCA(n_components=2).fit(x.numpy())
+    broken = readout.TorchPCA(pca, standins.CPU)
+    broken.projection = -broken.projection
+    registry = readout.SAERegistry(standins.CPU)
+    registry.saes["tiny", "hook"] = standins.TinySAE(args.d_model, args.d_sae, args.seed)
+    registry.pcas["broken-pca"] = (pca, broken)
+    layer = readout.LayerReadout({"hook_point": "hook", "sae_release": "tiny", "sae_id": "hook", "features": [0], "pca": "broken-pca"}, registry)
+    expected = torch.as_tensor(pca.transform(x[:4].numpy()), dtype=torch.float32)
+    return torch.allclose(layer.project(x[:4]), expected, atol=1e-5)
+
+if __name__ == "__main__":
+    args = get_args()
+    readout = standins.load_module("polysemantic", "readout")
+    generator = torch.Generator().manual_seed(args.seed)
+    # anisotropic data, so whitening rescales the components by clearly different variances
+    x = torch.randn(args.samples, args.d_model, generator=generator) * torch.linspace(0.1, 3.0, args.d_model) + 0.5
+
+    checks = {
+        "FeatureReadout == sae.encode": lambda: check_feature_readout(readout, args, x),
+        "TorchPCA == PCA.transform": lambda: check_pca(readout, args, x, whiten=False),
+        "TorchPCA == PCA.transform (whiten)": lambda: check_pca(readout, args, x, whiten=True),
+        "LayerReadout falls back to sklearn": lambda: check_pca_fallback(readout, args, x),
+    }
+    failures = 0
+    with torch.no_grad():
+        for name, check in checks.items():
+            ok = check()
+            failures += not ok
+            print(f"{'ok' if ok else 'MISMATCH':>8}  {name}")
+    if failures:
+        raise SystemExit(1)
@@ -0,0 +1,85 @@
+"""
+Checks that every way surgery_sim runs a progressive steering plan gives the same curve of target
+log-prob changes on the tiny random Llama: sequential passes with and without the resumable engine,
+batched passes in one go or in memory_budget_mb chunks, with and without the engine, and the scoring
+mode. Plans are random mixes of set/scale/add knobs on both sites. Exits 1 on any mismatch.
+
+    python check_steering.py [--plans 20] [--max-knobs 12] [--atol 1e-4]
+"""
+import argparse
+import random
+import torch
+import torch.nn.functional as F
+import standins
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--plans", type=int, default=20)
+    parser.add_argument("--max-knobs", type=int, default=12)
+    parser.add_argument("--atol", type=float, default=1e-4)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+def random_plan(rng, steering, n_layers, hidden_size, intermediate_size, seq_len, num_knobs):
+    """num_knobs distinct random knobs, sorted the way steer_token_activations_logits sorts them."""
+    knobs = {}
+    while len(knobs) < num_knobs:
+        site = rng.choice(steering.SITES)
+        width = hidden_size if site == steering.OUTPUT else intermediate_size
+        # -1 is the last position, so positive indices stop before it to keep every knob distinct
+        layer, neuron, token = rng.randrange(n_layers), rng.randrange(width), rng.choice([rng.randrange(seq_len - 1), -1])
+        op = rng.choice(list(steering.OPS))
+        value = 0.0 if op == "set" else rng.uniform(-2, 2)
+        knobs[site, layer, token, neuron] = steering.Intervention(layer, neuron, token, op, value, site)
+    return sorted(knobs.values(), key=lambda x: (x.layer, x.token, x.neuron))
+
+def curves(model, steering, tiny, batch, input_strings, knobs, token_a):
+    """Log-prob change of token_a for the first prompt at every step, by execution path."""
+    plan = steering.SteeringPlan(knobs)
+    model_a, hooks, engine = tiny["model"], tiny["hooks"], tiny["engine"]
+    results = {}
+    for name, use_engine in [("sequential", None), ("sequential+engine", engine)]:
+        changes, _ = model.sequential_progressive_log_probs(model_a, batch, plan, hooks, token_a, use_engine)
+        results[name] = torch.stack(changes).float()
+    for budget in [None, 0.05, 1.0]:
+        for suffix, use_engine in [("", None), ("+engine", engine)]:
+            step_logits = model.batched_progressive_logits(model_a, batch, plan, hooks, budget, use_engine)
+            log_probs = F.log_softmax(step_logits[:, 0], dim=-1)
+            results[f"batched(budget={budget}){suffix}"] = (log_probs[:, token_a] - log_probs[0, token_a]).float()
+    scores = model.steer_token_activations_scores(model_a, tiny["tokenizer"], input_strings, knobs, [token_a], engine, hooks)
+    results["scores"] = scores["log_prob_changes"][:, 0, 0].float()
+    return results
+
+if __name__ == "__main__":
+    args = get_args()
+    model = standins.load_module("surgery_sim", "model")
+    steering = standins.load_module("surgery_sim", "steering")
+    tiny = standins.surgery_sim()
+    config = tiny["model"].config
+    n_layers, hidden_size, intermediate_size = config.num_hidden_layers, config.hidden_size, config.intermediate_size
+    rng = random.Random(args.seed)
+
+    failures = 0
+    with torch.no_grad():
+        for i in range(args.plans):
+            # two prompts of different lengths, so left padding is exercised
+            input_strings = ["The ocean is deep and", "Why is the sky blue on a clear summer day?"]
+            rng.shuffle(input_strings)
+            batch = model.tokenize_prompts(tiny["model"], tiny["tokenizer"], input_strings)
+            seq_len = batch["input_ids"].shape[1]
+            knobs = random_plan(rng, steering, n_layers, hidden_size, intermediate_size, seq_len, rng.randint(1, args.max_knobs))
+            token_a = rng.randrange(config.vocab_size)
+
+            results = curves(model, steering, tiny, batch, input_strings, knobs, token_a)
+            reference = results.pop("sequential").cpu()
+            mismatched = [
+                name for name, curve in results.items()
+                if curve.shape != reference.shape or not torch.allclose(curve.cpu(), reference, rtol=0, atol=args.atol)
+            ]
+            for name in mismatched:
+                diff = (results[name].cpu() - reference).abs().max().item() if results[name].shape == reference.shape else float("nan")
+                print(f"MISMATCH plan {i} ({len(knobs)} knobs): {name} differs from sequential by {diff:.2e}")
+            failures += len(mismatched)
+            print(f"{'ok' if not mismatched else 'MISMATCH':>8}  plan {i}: {len(knobs)} knobs, {len(results)} paths against sequential")
+    if failures:
+        raise SystemExit(1)
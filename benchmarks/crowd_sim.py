@@ -0,0 +1,215 @@
+"""
+Crowd-load simulator: many players, each playing a short session of repeated guesses or growing strokes,
+arriving in bursts. Sessions are replayed either over HTTP against a local server (the gateway, or the
+Express server) or in-process through the gateway's routing and model queues.
+
+    python crowd_sim.py --url http://localhost:4168 --sessions 200 --arrival-rate 20 --concurrency 50
+    python crowd_sim.py --in-process --standins --games adversarial_ml polysemantic --sessions 100
+    python crowd_sim.py --url http://localhost:4168 --record sessions.jsonl
+
+--record replays sessions from a JSONL file, one per line:
+    {"route": "/coordinates", "requests": [{"word": "water"}, {"word": "rain"}], "think_ms": 500}
+Request bodies use the routes' HTTP shapes (see gateway/gateway.py), in both modes.
+
+surgery_sim is not simulated: its Predictor has no prompt input yet and answers every knob turn with
+{"prediction": None} without a forward pass, so its latencies would measure a no-op.
+
+Sessions start as a Poisson process at --arrival-rate per second (all at once if 0), at most --concurrency
+run at a time, and requests inside a session wait an exponential think time between them. The report gives
+throughput, latency percentiles and error rate per --interval of wall time and overall.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "gateway"))
+import gateway
+
+ROUTE_OF_GAME = {game: route for route, (game, _, _) in gateway.ROUTES.items()}
+# games whose Predictor does real work per request; see the module docstring for surgery_sim
+SIMULATED_GAMES = ["adversarial_ml", "polysemantic"]
+WORDS = ["water", "ocean", "rain", "fire", "ice", "river", "cloud", "sand", "steam", "lake", "snow", "tea"]
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", type=str, default=None, help="Base URL of a local server")
+    parser.add_argument("--in-process", action="store_true", help="Serve with the gateway's queues in this process")
+    parser.add_argument("--standins", action="store_true", help="In-process with random-weight stand-ins instead of the real models")
+    parser.add_argument("--games", nargs="+", choices=SIMULATED_GAMES, default=SIMULATED_GAMES)
+    parser.add_argument("--record", type=str, default=None, help="JSONL of recorded sessions to replay instead of synthetic ones")
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--requests-per-session", type=int, default=8)
+    parser.add_argument("--arrival-rate", type=float, default=10.0, help="New sessions per second, 0 for all at once")
+    parser.add_argument("--concurrency", type=int, default=32, help="Sessions running at the same time")
+    parser.add_argument("--think-ms", type=float, default=200.0, help="Mean pause between a player's requests")
+    parser.add_argument("--queue-size", type=int, default=64, help="Per-model queue size in-process")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds per row of the time series")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", type=str, default=None)
+    args = parser.parse_args()
+    if args.standins:
+        args.in_process = True
+    if bool(args.url) == args.in_process:
+        parser.error("pass exactly one of --url and --in-process")
+    return args
+
+def synthetic_session(rng, game, num_requests, think_ms):
+    """A player's session for game: guesses, or a stroke growing a few pixels at a time."""
+    if game == "polysemantic":
+        requests = [{"word": rng.choice(WORDS)} for _ in range(num_requests)]
+    else:
+        x, y, points, requests = rng.randrange(28), rng.randrange(28), [], []
+        for _ in range(num_requests):
+            for _ in range(rng.randint(1, 6)):
+                x, y = min(27, max(0, x + rng.choice([-1, 0, 1]))), min(27, max(0, y + rng.choice([-1, 0, 1])))
+                points += [x, y]
+            requests.append({"points": list(points)})
+    return {"route": ROUTE_OF_GAME[game], "requests": requests, "think_ms": think_ms}
+
+def load_sessions(args, rng):
+    if args.record:
+        with open(args.record) as f:
+            sessions = [json.loads(line) for line in f if line.strip()]
+        routes = {ROUTE_OF_GAME[game] for game in SIMULATED_GAMES}
+        for session in sessions:
+            if session["route"] not in routes:
+                raise SystemExit(f"Cannot replay {session['route']}: only {sorted(routes)} are simulated")
+        return [{"think_ms": args.think_ms, **session} for session in sessions]
+    return [
+        synthetic_session(rng, rng.choice(args.games), args.requests_per_session, args.think_ms)
+        for _ in range(args.sessions)
+    ]
+
+def build_in_process(args):
+    """A gateway.Gateway around the requested games, real or stand-in, without its HTTP layer."""
+    # only in-process runs need torch and the game code
+    import standins
+    builders = {
+        "adversarial_ml": standins.adversarial_ml,
+        "polysemantic": standins.polysemantic,
+    }
+    workers = {}
+    for game in args.games:
+        predictor = builders[game]() if args.standins else gateway.load_predictor(game)
+        workers[game] = gateway.ModelWorker(game, predictor, args.queue_size)
+    return gateway.Gateway(workers)
+
+def http_post(url, body):
+    """Status of one POST; HTTP errors count as responses, not as exceptions."""
+    request = urllib.request.Request(url, data=json.dumps(body).encode(), headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=300) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+class CrowdSimulator:
+    def __init__(self, args, send):
+        self.args = args
+        self.send = send
+        self.records = []
+        self.start = None
+
+    async def play(self, session, rng, slots):
+        async with slots:
+            for i, body in enumerate(session["requests"]):
+                if i and session["think_ms"]:
+                    await asyncio.sleep(rng.expovariate(1000 / session["think_ms"]))
+                sent = time.perf_counter()
+                try:
+                    status = await self.send(session["route"], body)
+                except Exception as e:
+                    status = repr(e)
+                self.records.append({
+                    "route": session["route"],
+                    "sent_s": sent - self.start,
+                    "latency_ms": (time.perf_counter() - sent) * 1000,
+                    "ok": status == 200,
+                    "status": status,
+                })
+
+    async def run(self, sessions):
+        rng = random.Random(self.args.seed)
+        slots = asyncio.Semaphore(self.args.concurrency)
+        self.start = time.perf_counter()
+        players = []
+        for session in sessions:
+            players.append(asyncio.create_task(self.play(session, random.Random(rng.random()), slots)))
+            if self.args.arrival_rate > 0:
+                await asyncio.sleep(rng.expovariate(self.args.arrival_rate))
+        await asyncio.gather(*players)
+        return time.perf_counter() - self.start
+
+def summarize(records, elapsed):
+    latencies = sorted(r["latency_ms"] for r in records if r["ok"])
+    pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else None
+    return {
+        "requests": len(records),
+        "throughput_rps": len(records) / elapsed if elapsed else 0.0,
+        "error_rate": sum(not r["ok"] for r in records) / len(records) if records else 0.0,
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+    }
+
+def time_series(records, interval):
+    """summarize() per interval of send time, so bursts and queue build-up show over the run."""
+    buckets = {}
+    for record in records:
+        buckets.setdefault(int(record["sent_s"] // interval), []).append(record)
+    return [{"start_s": i * interval, **summarize(buckets.get(i, []), interval)} for i in range(max(buckets, default=-1) + 1)]
+
+def print_row(label, stats):
+    fmt = lambda v: "-" if v is None else f"{v:.1f}"
+    print(f"{label:>9}{stats['requests']:>9}{stats['throughput_rps']:>10.1f}{stats['error_rate']:>8.1%}"
+          f"{fmt(stats['p50_ms']):>10}{fmt(stats['p95_ms']):>10}{fmt(stats['p99_ms']):>10}")
+
+async def main(args):
+    sessions = load_sessions(args, random.Random(args.seed))
+    if args.in_process:
+        server = build_in_process(args)
+        workers = [asyncio.create_task(worker.run()) for worker in server.workers.values()]
+
+        async def send(route, body):
+            status, _ = await server.handle("POST", route, json.dumps(body).encode())
+            return status
+    else:
+        executor = ThreadPoolExecutor(max_workers=args.concurrency)
+        base_url = args.url.rstrip("/")
+
+        async def send(route, body):
+            return await asyncio.get_running_loop().run_in_executor(executor, http_post, base_url + route, body)
+
+    simulator = CrowdSimulator(args, send)
+    elapsed = await simulator.run(sessions)
+    if args.in_process:
+        for task in workers:
+            task.cancel()
+
+    series = time_series(simulator.records, args.interval)
+    overall = summarize(simulator.records, elapsed)
+    by_route = {
+        route: summarize([r for r in simulator.records if r["route"] == route], elapsed)
+        for route in sorted({r["route"] for r in simulator.records})
+    }
+    print(f"{'t (s)':>9}{'requests':>9}{'req/s':>10}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for row in series:
+        print_row(f"{row['start_s']:g}", row)
+    print_row("overall", overall)
+    for route, stats in by_route.items():
+        print(f"{route}: " + ", ".join(f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}" for k, v in stats.items()))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"overall": overall, "by_route": by_route, "time_series": series, "elapsed_s": elapsed}, f, indent=2)
+
+if __name__ == "__main__":
+    asyncio.run(main(get_args()))
@@ -0,0 +1,239 @@
+"""
+Offline benchmarks of every game's hot path on small random-weight stand-ins (see standins.py), on CPU
+and without network access.
+
+    python run_benchmarks.py [--games surgery_sim adversarial_ml polysemantic] [--quick]
+    python run_benchmarks.py --save-baseline baseline.json     # record a baseline on this machine
+    python run_benchmarks.py --baseline baseline.json          # exit 1 if any case got slower
+
+Each case runs one hot path at a batch size, sequence length and intervention count, and records
+latency percentiles, throughput in rows per second and the case's own peak RSS: the kernel's high-water
+mark is reset before every case (Linux /proc/self/clear_refs), and peak_rss_delta_mb is how far the
+case's peak rose above the RSS it started at. A case regresses when its median latency exceeds the
+baseline by more than --tolerance and --min-delta-ms, or its peak RSS delta by more than
+--memory-tolerance and --min-delta-mb. Baselines are machine-specific; record them on the machine that
+checks against them.
+"""
+import argparse
+import gc
+import itertools
+import json
+import os
+import random
+import time
+import torch
+import standins
+
+GAMES = ["surgery_sim", "adversarial_ml", "polysemantic"]
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", nargs="+", choices=GAMES, default=GAMES)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--seq-lens", type=int, nargs="+", default=[16, 64])
+    parser.add_argument("--interventions", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--quick", action="store_true", help="Smallest and largest size of every axis only")
+    parser.add_argument("--report", type=str, default=None)
+    parser.add_argument("--save-baseline", type=str, default=None)
+    parser.add_argument("--baseline", type=str, default=None)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown of the median latency")
+    parser.add_argument("--min-delta-ms", type=float, default=0.2, help="Slowdowns below this many ms are noise")
+    parser.add_argument("--memory-tolerance", type=float, default=0.25, help="Allowed relative growth of the peak RSS delta")
+    parser.add_argument("--min-delta-mb", type=float, default=4.0, help="Peak RSS growth below this many MB is noise")
+    args = parser.parse_args()
+    if args.quick:
+        args.batch_sizes = sorted({min(args.batch_sizes), max(args.batch_sizes)})
+        args.seq_lens = sorted({min(args.seq_lens), max(args.seq_lens)})
+        args.interventions = sorted({min(args.interventions), max(args.interventions)})
+    return args
+
+def reset_peak_rss():
+    """Resets the process's RSS high-water mark to its current RSS; False where the kernel does not support it."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def status_mb(field):
+    """VmRSS (current) or VmHWM (peak since the last reset) from /proc/self/status, in MB."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    return None
+
+def measure(fn, rows, repeats, warmup):
+    gc.collect()
+    # without a resettable high-water mark the peak would be the whole run's, so report none at all
+    per_case_memory = reset_peak_rss()
+    start_rss = status_mb("VmRSS") if per_case_memory else None
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    peak_rss = status_mb("VmHWM") if per_case_memory else None
+    latencies.sort()
+    pick = lambda q: 1000 * latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+    return {
+        "latency_p50_ms": pick(0.5),
+        "latency_p95_ms": pick(0.95),
+        "throughput_rows_per_s": rows * len(latencies) / sum(latencies),
+        "peak_rss_mb": peak_rss,
+        "peak_rss_delta_mb": None if peak_rss is None else peak_rss - start_rss,
+    }
+
+def text_of_length(rng, length):
+    return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz ") for _ in range(length))
+
+def session_turns(model, steering, tiny, prompts, knobs):
+    """
+    A player's consecutive requests in one session: every call turns the last knob to the other of two
+    values, so after the first call each request resumes from that knob's layer.
+    """
+    last = knobs[-1]
+    turned = knobs[:-1] + [steering.Intervention(last.layer, last.neuron, last.token, last.op, last.value + 1.0)]
+    configurations = itertools.cycle([knobs, turned])
+    session_id = f"bench-{len(prompts)}-{len(prompts[0])}-{len(knobs)}"
+
+    def turn():
+        batch = model.tokenize_prompts(tiny["model"], tiny["tokenizer"], prompts, tiny["prompt_cache"])
+        return tiny["sessions"].last_logits(session_id, tuple(prompts), batch, next(configurations), tiny["hooks"])
+    return turn
+
+def surgery_sim_cases(args):
+    """
+    The Predictor.predict hot paths (sequential steering on the resumable engine, and a session's
+    incremental SessionCache.last_logits as one knob is turned back and forth), plus the batched
+    steer_token_activations_logits and the scoring mode.
+    """
+    model = standins.load_module("surgery_sim", "model")
+    steering = standins.load_module("surgery_sim", "steering")
+    tiny = standins.surgery_sim()
+    n_layers, hidden_size = len(tiny["model"].model.layers), tiny["model"].config.hidden_size
+    rng = random.Random(0)
+    for batch_size in args.batch_sizes:
+        for seq_len in args.seq_lens:
+            prompts = [text_of_length(rng, seq_len) for _ in range(batch_size)]
+            for num_interventions in args.interventions:
+                knobs = [
+                    steering.Intervention(rng.randrange(n_layers), rng.randrange(hidden_size), rng.randrange(seq_len), "scale", rng.uniform(0, 2))
+                    for _ in range(num_interventions)
+                ]
+                shape = {"batch": batch_size, "seq": seq_len, "interventions": num_interventions}
+                yield "surgery_sim.steer_sequential", shape, batch_size, lambda: model.steer_token_activations_logits(
+                    tiny["model"], tiny["tokenizer"], prompts, knobs, 3, standins.CPU,
+                    engine=tiny["engine"], hooks=tiny["hooks"], prompt_cache=tiny["prompt_cache"],
+                )
+                yield "surgery_sim.session_last_logits", shape, batch_size, session_turns(model, steering, tiny, prompts, knobs)
+                yield "surgery_sim.steer_logits", shape, batch_size, lambda: model.steer_token_activations_logits(
+                    tiny["model"], tiny["tokenizer"], prompts, knobs, 0, None, batched=True,
+                    engine=tiny["engine"], hooks=tiny["hooks"], prompt_cache=tiny["prompt_cache"],
+                )
+                yield "surgery_sim.steer_scores", shape, batch_size, lambda: model.steer_token_activations_scores(
+                    tiny["model"], tiny["tokenizer"], prompts, knobs, [0, 1, 2], tiny["engine"], tiny["hooks"],
+                    prompt_cache=tiny["prompt_cache"],
+                )
+
+def adversarial_ml_cases(args):
+    """Batched sparse prediction and the solver's hint, with sequence length as pixels per stroke."""
+    predictor = standins.adversarial_ml()
+    generator = torch.Generator().manual_seed(0)
+
+    def stroke(num_pixels):
+        pixels = torch.randperm(28 * 28, generator=generator)[:num_pixels]
+        return torch.stack([pixels // 28, pixels % 28], dim=1).reshape(-1).tolist()
+
+    for seq_len in args.seq_lens:
+        for batch_size in args.batch_sizes:
+            drawings = [stroke(seq_len) for _ in range(batch_size)]
+            shape = {"batch": batch_size, "seq": seq_len, "interventions": 0}
+            yield "adversarial_ml.predict_batch", shape, batch_size, lambda: predictor.predict_batch(drawings)
+        drawn_coords = stroke(seq_len)
+        shape = {"batch": 1, "seq": seq_len, "interventions": 0}
+        yield "adversarial_ml.hint", shape, 1, lambda: predictor.solver.hint(drawn_coords)
+
+def polysemantic_cases(args):
+    """Batched residuals with every configured feature and projection, and one uncached guess end to end."""
+    predictor = standins.polysemantic()
+    layer = predictor.readouts.primary
+    rng = random.Random(0)
+    for seq_len in args.seq_lens:
+        for batch_size in args.batch_sizes:
+            guesses = [text_of_length(rng, seq_len) for _ in range(batch_size)]
+
+            def readout():
+                activations = predictor.residuals(guesses)
+                return layer.feature_activations(activations).tolist(), layer.project(activations).tolist()
+
+            shape = {"batch": batch_size, "seq": seq_len, "interventions": 0}
+            yield "polysemantic.readout_batch", shape, batch_size, readout
+
+        # a fresh guess every call, so the guess cache never answers
+        guesses = iter(text_of_length(rng, seq_len) for _ in range(args.warmup + args.repeats))
+        shape = {"batch": 1, "seq": seq_len, "interventions": 0}
+        yield "polysemantic.answer", shape, 1, lambda: predictor.answer(next(guesses), predictor.readouts.layers)
+
+CASES = {"surgery_sim": surgery_sim_cases, "adversarial_ml": adversarial_ml_cases, "polysemantic": polysemantic_cases}
+
+def case_id(name, shape):
+    return name + "|" + ",".join(f"{k}={v}" for k, v in shape.items())
+
+def compare(results, baseline, args):
+    """(case id, metric, baseline value, new value) of every median latency or peak RSS delta that regressed."""
+    limits = [
+        ("latency_p50_ms", args.tolerance, args.min_delta_ms),
+        ("peak_rss_delta_mb", args.memory_tolerance, args.min_delta_mb),
+    ]
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        for metric, tolerance, min_delta in limits:
+            before, after = baseline[key].get(metric), result.get(metric)
+            if before is None or after is None:
+                continue
+            if after > before * (1 + tolerance) and after - before > min_delta:
+                regressions.append((key, metric, before, after))
+    return regressions
+
+if __name__ == "__main__":
+    args = get_args()
+    torch.set_num_threads(args.threads)
+    # keep the stand-ins away from any deployment caches configured in the environment
+    os.environ.pop("GUESS_CACHE_PATH", None)
+
+    results = {}
+    for game in args.games:
+        with torch.no_grad():
+            for name, shape, rows, fn in CASES[game](args):
+                key = case_id(name, shape)
+                results[key] = {"name": name, **shape, **measure(fn, rows, args.repeats, args.warmup)}
+                r = results[key]
+                memory = "rss=-" if r["peak_rss_mb"] is None else f"rss={r['peak_rss_mb']:.0f}MB (+{r['peak_rss_delta_mb']:.1f}MB)"
+                print(f"{key:<72} p50={r['latency_p50_ms']:8.3f}ms p95={r['latency_p95_ms']:8.3f}ms "
+                      f"{r['throughput_rows_per_s']:10.1f} rows/s {memory}")
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline of {len(results)} cases to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args)
+        for key, metric, before, after in regressions:
+            print(f"REGRESSION {key} {metric}: {before:.3f} -> {after:.3f}")
+        if regressions:
+            raise SystemExit(1)
+        print(f"No regressions against {args.baseline} ({len(set(results) & set(baseline))} cases compared)")
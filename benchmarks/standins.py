@@ -0,0 +1,116 @@
+"""
+Small random-weight stand-ins for the game models, built in memory so benchmarks run on a CPU without
+downloads: a tiny Llama for surgery_sim, a random MNIST MLP for adversarial_ml, and a tiny
+HookedTransformer with a small SAE and PCA for polysemantic. Each keeps the module layout and
+interfaces the Predictors use, and is wired into the real Predictor code through its prepare().
+"""
+import importlib.util
+import os
+import sys
+import torch
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CPU = torch.device("cpu")
+
+def load_module(game, name):
+    """Imports games/<game>/api/<name>.py; the api modules import their neighbours flatly."""
+    api_dir = os.path.join(REPO_ROOT, "games", game, "api")
+    if api_dir not in sys.path:
+        sys.path.insert(0, api_dir)
+    if name != "predict":
+        return importlib.import_module(name)
+    # every game has a predict.py, so each gets its own module name
+    spec = importlib.util.spec_from_file_location(f"{game}_predict", os.path.join(api_dir, "predict.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def surgery_sim(n_layers=4, hidden_size=64, intermediate_size=256):
+    """
+    surgery_sim Predictor around a tiny Llama, set up through its prepare() without the warm-up pass.
+    Returned with the parts benchmarks call directly: model, tokenizer, engine, hooks, prompt_cache and sessions.
+    """
+    tiny_model = load_module("surgery_sim", "tiny_model")
+    model = load_module("surgery_sim", "model")
+    predict = load_module("surgery_sim", "predict")
+    model_a, tokenizer = tiny_model.load_tiny(n_layers=n_layers, hidden_size=hidden_size, intermediate_size=intermediate_size)
+    # what load_model would have set, with the defaults for everything else
+    args = model.get_args([])
+    args.module_str_dict = dict(model.LLAMA_MODULE_STR_DICT)
+    args.n_layers = n_layers
+    args.prompt_cache_size = 64
+    args.no_warmup = True
+    args.startup_report = None
+
+    predictor = predict.Predictor()
+    predictor.device = CPU
+    predictor.prepare(model_a, tokenizer, args, model.StartupTimer())
+    return {
+        "predictor": predictor,
+        "model": predictor.model,
+        "tokenizer": predictor.tokenizer,
+        "engine": predictor.engine,
+        "hooks": predictor.hooks,
+        "prompt_cache": predictor.prompt_cache,
+        "sessions": predictor.sessions,
+    }
+
+def adversarial_ml(seed=0):
+    """adversarial_ml Predictor around a random MLP and a random base image, labelled with the MLP's own prediction."""
+    predict = load_module("adversarial_ml", "predict")
+    torch.manual_seed(seed)
+    mlp = predict.MLP().eval()
+    img = torch.rand(28, 28)
+    with torch.no_grad():
+        label = torch.argmax(mlp(img.unsqueeze(0)), dim=1).item()
+    predictor = predict.Predictor()
+    predictor.prepare(mlp, img, label, CPU)
+    return predictor
+
+class TinySAE(torch.nn.Module):
+    """ReLU SAE with the attributes FeatureReadout and LayerReadout use (W_enc, b_enc, b_dec, cfg, encode)."""
+    class Config:
+        apply_b_dec_to_input = True
+
+    def __init__(self, d_in, d_sae, seed=0):
+        super().__init__()
+        generator = torch.Generator().manual_seed(seed)
+        self.cfg = self.Config()
+        self.W_enc = torch.nn.Parameter(torch.randn(d_in, d_sae, generator=generator) / d_in ** 0.5)
+        self.b_enc = torch.nn.Parameter(torch.zeros(d_sae))
+        self.W_dec = torch.nn.Parameter(self.W_enc.detach().t().clone())
+        self.b_dec = torch.nn.Parameter(torch.zeros(d_in))
+        self.activation_fn = torch.nn.ReLU()
+
+    def encode(self, x):
+        return self.activation_fn((x - self.b_dec * self.cfg.apply_b_dec_to_input) @ self.W_enc + self.b_enc)
+
+def polysemantic(n_layers=4, d_model=64, d_sae=512, features=(0, 1, 2, 3), seed=0):
+    """
+    polysemantic Predictor around a tiny HookedTransformer. The SAE and PCA are placed in the Predictor's
+    SAERegistry up front, so LayerReadout finds them there instead of downloading.
+    """
+    from sklearn.decomposition import PCA
+    from transformer_lens import HookedTransformer, HookedTransformerConfig
+    predict = load_module("polysemantic", "predict")
+    readout = load_module("polysemantic", "readout")
+    tokenizer = load_module("surgery_sim", "tiny_model").build_tiny_tokenizer()
+
+    torch.manual_seed(seed)
+    config = HookedTransformerConfig(
+        n_layers=n_layers, d_model=d_model, n_ctx=512, d_head=16, n_heads=d_model // 16,
+        d_mlp=4 * d_model, d_vocab=len(tokenizer), act_fn="gelu", device="cpu", seed=seed,
+    )
+    model = HookedTransformer(config).eval()
+
+    layer = n_layers // 2
+    hook_point = f"blocks.{layer}.hook_resid_post"
+    pca = PCA(n_components=2).fit(torch.randn(256, d_model, generator=torch.Generator().manual_seed(seed)).numpy())
+    registry = readout.SAERegistry(CPU)
+    registry.saes["tiny", hook_point] = TinySAE(d_model, d_sae, seed)
+    registry.pcas["tiny-pca"] = (pca, readout.TorchPCA(pca, CPU))
+    layers = [{"hook_point": hook_point, "sae_release": "tiny", "sae_id": hook_point, "features": list(features), "pca": "tiny-pca"}]
+
+    predictor = predict.Predictor()
+    predictor.prepare("tiny", model, tokenizer, layers, registry)
+    return predictor
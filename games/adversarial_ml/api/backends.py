@@ -0,0 +1,47 @@
+import os
+import tempfile
+import torch
+
+# Serving backends for the MLP, picked with the MNIST_BACKEND environment variable
+BACKENDS = ["eager", "torchscript", "compile", "onnx"]
+
+def compile_module(module, example_input, backend="eager", num_threads=None):
+    """
+    Returns a callable with the same inputs and outputs as module (float tensors in, float tensors out),
+    run through the requested backend. The batch dimension stays dynamic for every backend.
+
+    num_threads only sizes the ONNX Runtime session's own intra-op pool. The torch backends share torch's
+    process-wide pool, which this leaves alone since other models in the process (e.g. behind the gateway) use it too.
+    """
+    module.eval()
+    if backend == "eager":
+        return module
+    if backend == "torchscript":
+        with torch.no_grad():
+            traced = torch.jit.trace(module, example_input)
+        return torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+    if backend == "compile":
+        return torch.compile(module, dynamic=True)
+    if backend == "onnx":
+        return OnnxModule(module, example_input, num_threads)
+    raise ValueError(f"Unknown backend {backend}, expected one of {BACKENDS}")
+
+class OnnxModule:
+    """Exports module to ONNX and runs it with ONNX Runtime on the CPU."""
+    def __init__(self, module, example_input, num_threads=None):
+        import onnxruntime as ort
+
+        path = os.path.join(tempfile.mkdtemp(), "model.onnx")
+        torch.onnx.export(
+            module, example_input, path,
+            input_names=["input"], output_names=["output"],
+            dynamic_axes={"input": {0: "batch"}, "output": {0: "batch"}},
+        )
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def __call__(self, x):
+        output = self.session.run(None, {"input": x.detach().cpu().float().numpy()})[0]
+        return torch.from_numpy(output).to(x.device)
@@ -0,0 +1,75 @@
+"""
+Latency percentiles and throughput of Predictor.predict for each serving backend.
+
+    python bench_backends.py --backends eager torchscript onnx --threads 1 --requests 2000
+"""
+import argparse
+import inspect
+import os
+import time
+import torch
+from predict import Predictor
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", nargs="+", default=["eager", "torchscript", "compile", "onnx"])
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--stroke-size", type=int, default=40)
+    return parser.parse_args()
+
+def percentile(latencies, p):
+    return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))]
+
+def predict(predictor, **inputs):
+    """predictor.predict(**inputs) with every other argument at the default of its Cog Input, as Cog would call it."""
+    for name, param in inspect.signature(predictor.predict).parameters.items():
+        if name not in inputs and param.default is not inspect.Parameter.empty:
+            # outside Cog, Input(...) is a field object; the plain default lives on it
+            inputs[name] = getattr(param.default, "default", param.default)
+    return predictor.predict(**inputs)
+
+def load(backend, args):
+    os.environ["MNIST_BACKEND"] = backend
+    os.environ["MNIST_NUM_THREADS"] = str(args.threads)
+    predictor = Predictor()
+    predictor.setup()
+    return predictor
+
+def bench(predictor, strokes):
+    for drawn_coords in strokes[:50]:
+        predict(predictor, drawn_coords=drawn_coords)
+
+    latencies = []
+    start = time.perf_counter()
+    for drawn_coords in strokes:
+        request_start = time.perf_counter()
+        predict(predictor, drawn_coords=drawn_coords)
+        latencies.append(time.perf_counter() - request_start)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "p50_ms": 1000 * percentile(latencies, 50),
+        "p99_ms": 1000 * percentile(latencies, 99),
+        "requests_per_second": len(latencies) / elapsed,
+    }
+
+if __name__ == "__main__":
+    args = get_args()
+    # the benchmark owns its process, so torch backends get the same thread count as the ONNX session
+    torch.set_num_threads(args.threads)
+    generator = torch.Generator().manual_seed(0)
+    strokes = []
+    for _ in range(args.requests):
+        pixels = torch.randint(0, 28 * 28, (args.stroke_size,), generator=generator)
+        strokes.append(torch.stack([pixels // 28, pixels % 28], dim=1).reshape(-1).tolist())
+
+    for backend in args.backends:
+        # only a backend that fails to build is unavailable; errors while predicting are real failures
+        try:
+            predictor = load(backend, args)
+        except Exception as e:
+            print(f"{backend:>12}: unavailable ({e})")
+            continue
+        result = bench(predictor, strokes)
+        print(f"{backend:>12}: p50 {result['p50_ms']:.3f} ms, p99 {result['p99_ms']:.3f} ms, {result['requests_per_second']:.0f} req/s")
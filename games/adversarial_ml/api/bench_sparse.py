@@ -0,0 +1,57 @@
+"""
+Latency of the sparse first-layer update against the full MLP.forward, by stroke size. Also checks that
+both give the same predicted class and logits within --atol, and exits 1 if any stroke size drifts.
+
+    python bench_sparse.py --repeats 200 [--atol 1e-4]
+"""
+import argparse
+import time
+import torch
+from predict import Predictor
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--stroke-sizes", type=int, nargs="+", default=[1, 4, 16, 64, 256, 784])
+    parser.add_argument("--atol", type=float, default=1e-4, help="Largest allowed logit difference from MLP.forward")
+    return parser.parse_args()
+
+def time_ms(fn, repeats):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return 1000 * (time.perf_counter() - start) / repeats
+
+if __name__ == "__main__":
+    args = get_args()
+    predictor = Predictor()
+    predictor.setup()
+    generator = torch.Generator().manual_seed(0)
+
+    failures = []
+    print(f"{'pixels':>6} {'full ms':>9} {'sparse ms':>9} {'speedup':>8} {'max |diff|':>11}")
+    for k in args.stroke_sizes:
+        pixels = torch.randperm(28 * 28, generator=generator)[:k]
+        drawn_coords = torch.stack([pixels // 28, pixels % 28], dim=1).reshape(-1).tolist()
+
+        def full():
+            with torch.no_grad():
+                return predictor.model(predictor.draw([drawn_coords]).reshape(1, -1))
+
+        def sparse():
+            return predictor.forward_sparse([drawn_coords])
+
+        full_ms, sparse_ms = time_ms(full, args.repeats), time_ms(sparse, args.repeats)
+        expected, actual = full(), sparse()
+        diff = (expected - actual).abs().max().item()
+        print(f"{k:>6} {full_ms:>9.4f} {sparse_ms:>9.4f} {full_ms / sparse_ms:>7.2f}x {diff:>11.2e}")
+        if not torch.equal(expected.argmax(dim=1), actual.argmax(dim=1)):
+            failures.append(f"{k} pixels: predicted class {expected.argmax().item()} != {actual.argmax().item()}")
+        if not torch.allclose(expected, actual, rtol=0, atol=args.atol):
+            failures.append(f"{k} pixels: max |diff| {diff:.2e} > {args.atol:.0e}")
+
+    for failure in failures:
+        print(f"MISMATCH {failure}")
+    if failures:
+        raise SystemExit(1)
@@ -0,0 +1,45 @@
+"""
+Payload size and decode time of the drawn_coords list against the compact bitmap and RLE strokes.
+
+    python bench_strokes.py --points 2000 --repeats 500
+"""
+import argparse
+import json
+import time
+import torch
+import strokes
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, nargs="+", default=[50, 500, 5000], help="Stroke points per scribble, with repeats")
+    parser.add_argument("--repeats", type=int, default=500)
+    return parser.parse_args()
+
+def scribble(num_points, generator):
+    """A random walk over the canvas, which revisits pixels the way real scribbles do."""
+    steps = torch.randint(-1, 2, (num_points, 2), generator=generator)
+    start = torch.randint(0, 28, (1, 2), generator=generator)
+    return (start + steps.cumsum(dim=0)).clamp(0, 27).reshape(-1).tolist()
+
+def time_us(fn, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return 1e6 * (time.perf_counter() - start) / repeats
+
+if __name__ == "__main__":
+    args = get_args()
+    generator = torch.Generator().manual_seed(0)
+    print(f"{'points':>7} {'format':>7} {'bytes':>7} {'decode us':>10}")
+    for num_points in args.points:
+        drawn_coords = scribble(num_points, generator)
+        mask = strokes.coords_to_mask(drawn_coords)
+        payloads = {
+            "list": (json.dumps(drawn_coords), lambda p: strokes.coords_to_mask(json.loads(p))),
+            "bitmap": (strokes.encode_bitmap(mask), strokes.decode_stroke),
+            "rle": (strokes.encode_rle(mask), strokes.decode_stroke),
+        }
+        for name, (payload, decode) in payloads.items():
+            assert torch.equal(decode(payload), mask)
+            decode_us = time_us(lambda: decode(payload), args.repeats)
+            print(f"{num_points:>7} {name:>7} {len(payload.encode()):>7} {decode_us:>10.1f}")
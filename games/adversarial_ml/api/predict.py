@@ -2,8 +2,14 @@
 # https://cog.run/python
 
 from cog import BasePredictor, Input
+import json
+import os
 import torch
 import torch.nn as nn
+import backends
+import instrumentation
+import solver
+import strokes
 
 class MLP(nn.Module):
   def __init__(self):
@@ -25,34 +31,143 @@ class MLP(nn.Module):
 class Predictor(BasePredictor):
     def setup(self) -> None:
         """Load the model into memory to make running multiple predictions efficient"""
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.model = MLP()
-        self.model.load_state_dict(torch.load('misc/CPU_WEIGHTS.pth'))
-        self.model = self.model.to(self.device)
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        model = MLP()
+        model.load_state_dict(torch.load('misc/CPU_WEIGHTS.pth'))
+        self.prepare(model, torch.load('misc/three.pt'), 3, device)
+
+    def prepare(self, model, img, label, device):
+        """Everything setup derives from the weights and the base image; benchmarks call it with stand-ins"""
+        self.device = device
+        self.model = model.to(self.device)
         self.model.eval()
 
-        self.img = torch.load('misc/three.pt').to(self.device)
-        self.label = 3
+        self.img = img.to(self.device)
+        self.max_val = torch.max(self.img)
+        self.label = label
 
-    def predict(
-        self,
-        drawn_coords: list[int] = Input(description="List of drawn coordinates, e.g., [1, 2, 3, 4] for [1,2] and [3,4]"),
-    ) -> dict:
-        """Run a single prediction on the model"""
+        # A drawing only changes a few pixels of the base image, so keep the base image's first-layer
+        # pre-activation and update it with the weight columns of the changed pixels only
+        first_layer = self.model.linear_relu_stack[0]
+        self.base_flat = self.img.reshape(-1)
+        with torch.no_grad():
+            self.base_pre_activation = first_layer(self.base_flat.unsqueeze(0))[0]
+        self.first_weight_t = first_layer.weight.detach().t().contiguous()
+
+        # Optional compiled backend for the layers after the sparse update, e.g. MNIST_BACKEND=onnx MNIST_NUM_THREADS=1;
+        # the thread count only applies to the ONNX session, torch's thread pool is process-wide and left alone
+        self.backend = os.environ.get("MNIST_BACKEND", "eager")
+        num_threads = int(os.environ.get("MNIST_NUM_THREADS", 0))
+        self.remaining_layers = backends.compile_module(
+            self.model.linear_relu_stack[1:], self.base_pre_activation.unsqueeze(0), self.backend, num_threads
+        )
+
+        self.solver = solver.MinimalPixelSolver(self)
+        instrumentation.serve_metrics(int(os.environ.get("METRICS_PORT", 0)))
+
+    def draw(self, drawings):
+        """Stamps every drawing onto its own copy of the base image with a single index scatter"""
+        edited = self.img.unsqueeze(0).repeat(len(drawings), 1, 1)
+
+        # Each drawing is a flat list of ints, e.g. [1, 2, 3, 4] for [1,2] and [3,4]
+        lengths = torch.tensor([len(coords) // 2 for coords in drawings], device=self.device)
+        coords = torch.tensor([c for coords in drawings for c in coords], dtype=torch.long, device=self.device).view(-1, 2)
+        rows = torch.repeat_interleave(torch.arange(len(drawings), device=self.device), lengths)
+        edited[rows, coords[:, 0], coords[:, 1]] = self.max_val
+
+        return edited
 
-        # Clone image to avoid modifying original
-        edited = self.img.clone()
-        max_val = torch.max(edited)
+    def changed_pixels(self, drawings):
+        """
+        (row, flat pixel index, value change) of every pixel that differs from the base image, one entry
+        per pixel and drawing however many times it was stroked.
+        drawings is a list of drawn_coords lists, or a (n, 784) bool tensor of decoded stroke masks.
+        """
+        if isinstance(drawings, torch.Tensor):
+            rows, flat = drawings.to(self.device).nonzero(as_tuple=True)
+            delta = self.max_val - self.base_flat[flat]
+            changed = delta != 0
+            return rows[changed], flat[changed], delta[changed]
 
-        # Example of drawn_coords: "1,2|3,4"
-        for i in range(0, len(drawn_coords), 2):
-            x, y = drawn_coords[i], drawn_coords[i+1]
-            edited[x, y] = max_val
+        n, (height, width) = len(drawings), self.img.shape
+        lengths = torch.tensor([len(coords) // 2 for coords in drawings], device=self.device)
+        coords = torch.tensor([c for coords in drawings for c in coords], dtype=torch.long, device=self.device).view(-1, 2)
+        rows = torch.repeat_interleave(torch.arange(n, device=self.device), lengths)
+        flat = strokes.coords_to_flat(coords)
 
-        edited = edited.reshape(1, -1)
+        keys = torch.unique(rows * flat.new_tensor(height * width) + flat)
+        rows, flat = keys // (height * width), keys % (height * width)
+        delta = self.max_val - self.base_flat[flat]
+        changed = delta != 0
+        return rows[changed], flat[changed], delta[changed]
 
+    def sparse_pre_activation(self, drawings):
+        """First-layer pre-activation of every drawing, from the base image's plus the changed pixels' weight columns"""
+        rows, flat, delta = self.changed_pixels(drawings)
         with torch.no_grad():
-            output = self.model(edited)
-            predicted_class = torch.argmax(output, dim=1).item()
+            pre_activation = self.base_pre_activation.repeat(len(drawings), 1)
+            pre_activation.index_add_(0, rows, self.first_weight_t[flat] * delta[:, None])
+        return pre_activation
+
+    def forward_sparse(self, drawings):
+        """
+        Same logits as self.model(self.draw(drawings)), up to float summation order, at O(k*512) cost
+        for k changed pixels instead of a full 784x512 matmul per drawing
+        """
+        with torch.no_grad():
+            return self.remaining_layers(self.sparse_pre_activation(drawings))
+
+    def decode_drawings(self, drawings):
+        """
+        Drawings as sent by clients: drawn_coords lists are kept as they are, but as soon as one drawing
+        uses a compact "bitmap:..." or "rle:..." stroke, all of them are decoded into a (n, 784) mask tensor
+        """
+        if not any(isinstance(d, str) for d in drawings):
+            return drawings
+        return torch.stack([strokes.decode_stroke(d) if isinstance(d, str) else strokes.coords_to_mask(d) for d in drawings])
+
+    def predict_batch(self, drawings):
+        """Predictions and class probabilities for many drawings from one forward pass"""
+        instrumentation.set_batch_size(len(drawings))
+        with instrumentation.stage("decode"):
+            drawings = self.decode_drawings(drawings)
+        with torch.no_grad(), instrumentation.stage("forward"):
+            output = self.forward_sparse(drawings)
+            probabilities = torch.softmax(output, dim=1)
+            predicted_classes = torch.argmax(output, dim=1)
+
+        with instrumentation.stage("readback"):
+            return {"predictions": predicted_classes.tolist(), "probabilities": probabilities.tolist()}
+
+    def predict(
+        self,
+        drawn_coords: list[int] = Input(description="List of drawn coordinates, e.g., [1, 2, 3, 4] for [1,2] and [3,4]", default=[]),
+        stroke: str = Input(description="Compact alternative to drawn_coords: 'bitmap:<base64 28x28 bitmask>' or 'rle:<start,length,...>'", default=""),
+        drawings: str = Input(description="Batch mode: JSON list of drawn_coords lists or compact strokes, scored in one forward pass", default=""),
+        mode: str = Input(description="predict, hint (best next pixel) or score (pixels used vs the greedy solution)", default="predict", choices=["predict", "hint", "score"]),
+    ) -> dict:
+        """Run a single prediction on the model"""
+        with instrumentation.request("adversarial_ml"):
+            if drawings:
+                return self.predict_batch(json.loads(drawings))
+            drawing = [drawn_coords]
+            if stroke:
+                with instrumentation.stage("decode"):
+                    drawing = strokes.decode_stroke(stroke).unsqueeze(0)
+                    if mode != "predict":
+                        # the solver works on coordinates, so hand it the decoded pixels in drawn_coords form
+                        flat = drawing[0].nonzero().view(-1)
+                        drawn_coords = torch.stack([flat // strokes.WIDTH, flat % strokes.WIDTH], dim=1).view(-1).tolist()
+            if mode == "hint":
+                with instrumentation.stage("solver"):
+                    return self.solver.hint(drawn_coords)
+            if mode == "score":
+                with instrumentation.stage("solver"):
+                    return self.solver.score(drawn_coords)
+
+            with torch.no_grad(), instrumentation.stage("forward"):
+                output = self.forward_sparse(drawing)
+            with instrumentation.stage("readback"):
+                predicted_class = torch.argmax(output, dim=1).item()
 
         return {"prediction": predicted_class}
@@ -0,0 +1,86 @@
+import torch
+
+class MinimalPixelSolver:
+    """
+    Finds small sets of pixels that flip the MLP's prediction away from the base image's label,
+    for hints ("try this pixel next") and for scoring players against a greedy solution. Greedy
+    selection is not guaranteed to find the minimal set, so players can beat it.
+
+    Every candidate single-pixel addition is evaluated in one batched pass: on top of a drawing's
+    first-layer pre-activation, adding pixel p only adds its weight column scaled by its change,
+    so all 784 candidates are a (784, 512) update followed by the remaining layers.
+    """
+    def __init__(self, predictor):
+        self.predictor = predictor
+        self.label = predictor.label
+        self._base_solution = None
+
+    def _margins(self, pre_activation, image_flat):
+        """
+        Label logit minus the best other logit after adding each candidate pixel, shape (784,).
+        Pixels that are already at the drawing value cannot change anything and get +inf.
+        """
+        p = self.predictor
+        delta = p.max_val - image_flat
+        with torch.no_grad():
+            candidates = pre_activation.unsqueeze(0) + p.first_weight_t * delta[:, None]
+            logits = p.remaining_layers(candidates)
+        label_logits = logits[:, self.label].clone()
+        logits[:, self.label] = float("-inf")
+        margins = label_logits - logits.max(dim=1).values
+        return torch.where(delta != 0, margins, torch.full_like(margins, float("inf")))
+
+    def _state(self, drawn_coords):
+        """Pre-activation and flattened image of one drawing."""
+        p = self.predictor
+        pre_activation = p.sparse_pre_activation([drawn_coords])[0]
+        _, flat, _ = p.changed_pixels([drawn_coords])
+        image_flat = p.base_flat.clone()
+        image_flat[flat] = p.max_val
+        return pre_activation, image_flat
+
+    def _to_coords(self, flat):
+        width = self.predictor.img.shape[1]
+        return [flat // width, flat % width]
+
+    def hint(self, drawn_coords):
+        """The single pixel that pushes this drawing furthest from the label, from one batched pass."""
+        pre_activation, image_flat = self._state(drawn_coords)
+        margins = self._margins(pre_activation, image_flat)
+        best = torch.argmin(margins).item()
+        return {"pixel": self._to_coords(best), "margin": margins[best].item(), "flips": margins[best].item() < 0}
+
+    @torch.no_grad()
+    def solve(self, drawn_coords=(), max_pixels=None):
+        """
+        Greedily grows a pixel set on top of drawn_coords until the prediction is no longer the label,
+        adding the best candidate from one batched pass per step. Returns the added pixels.
+        """
+        p = self.predictor
+        pre_activation, image_flat = self._state(list(drawn_coords))
+        max_pixels = max_pixels or image_flat.numel()
+        pixels = []
+        prediction = torch.argmax(p.remaining_layers(pre_activation.unsqueeze(0)), dim=1).item()
+        while prediction == self.label and len(pixels) < max_pixels:
+            margins = self._margins(pre_activation, image_flat)
+            best = torch.argmin(margins).item()
+            if margins[best] == float("inf"):
+                break
+            pre_activation = pre_activation + p.first_weight_t[best] * (p.max_val - image_flat[best])
+            image_flat[best] = p.max_val
+            pixels.append(self._to_coords(best))
+            if margins[best] < 0:
+                prediction = torch.argmax(p.remaining_layers(pre_activation.unsqueeze(0)), dim=1).item()
+        return {"pixels": pixels, "count": len(pixels), "prediction": prediction}
+
+    def base_solution(self):
+        """Greedy pixel set for the untouched base image, computed once and cached. An upper bound on the minimum, not the minimum."""
+        if self._base_solution is None:
+            self._base_solution = self.solve()
+        return self._base_solution
+
+    def score(self, drawn_coords):
+        """How many pixels the player changed next to the cached greedy solution for the base image."""
+        _, flat, _ = self.predictor.changed_pixels([drawn_coords])
+        greedy = self.base_solution()
+        return {"pixels_used": flat.numel(), "greedy_best": greedy["count"], "greedy_best_pixels": greedy["pixels"]}
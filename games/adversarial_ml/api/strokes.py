@@ -0,0 +1,70 @@
+import base64
+import torch
+
+# Compact stroke encodings, as an alternative to the flat drawn_coords list:
+#   "bitmap:<base64>"  28x28 bitmask, row-major, most significant bit first (98 bytes before base64)
+#   "rle:<start>,<length>,..."  runs of drawn pixels over the row-major flattened image
+HEIGHT, WIDTH = 28, 28
+NUM_PIXELS = HEIGHT * WIDTH
+BITMAP_BYTES = NUM_PIXELS // 8
+
+_BIT_SHIFTS = torch.arange(7, -1, -1, dtype=torch.uint8)
+
+def decode_bitmap(payload):
+    """Unpacks a base64 bitmask into a (784,) bool mask."""
+    data = base64.b64decode(payload, validate=True)
+    if len(data) != BITMAP_BYTES:
+        raise ValueError(f"bitmap must be {BITMAP_BYTES} bytes, got {len(data)}")
+    packed = torch.frombuffer(bytearray(data), dtype=torch.uint8)
+    return ((packed[:, None] >> _BIT_SHIFTS) & 1).reshape(-1).bool()
+
+def decode_rle(payload):
+    """Expands comma-separated (start, length) runs into a (784,) bool mask."""
+    values = [int(v) for v in payload.split(",")] if payload.strip() else []
+    if len(values) % 2:
+        raise ValueError("rle must hold (start, length) pairs")
+    runs = torch.tensor(values, dtype=torch.long).view(-1, 2)
+    starts, ends = runs[:, 0], runs[:, 0] + runs[:, 1]
+    if ((starts < 0) | (runs[:, 1] < 0) | (ends > NUM_PIXELS)).any():
+        raise ValueError(f"rle runs must lie within [0, {NUM_PIXELS})")
+    # +1 at every run start and -1 at every run end; pixels with a positive prefix sum are inside a run
+    edges = torch.zeros(NUM_PIXELS + 1, dtype=torch.long)
+    edges.index_add_(0, starts, torch.ones_like(starts))
+    edges.index_add_(0, ends, -torch.ones_like(ends))
+    return edges.cumsum(dim=0)[:NUM_PIXELS] > 0
+
+def decode_stroke(stroke):
+    """Decodes a "bitmap:..." or "rle:..." stroke into a (784,) bool mask."""
+    kind, _, payload = stroke.partition(":")
+    if kind == "bitmap":
+        return decode_bitmap(payload)
+    if kind == "rle":
+        return decode_rle(payload)
+    raise ValueError(f"Unknown stroke encoding {kind!r}, expected 'bitmap' or 'rle'")
+
+def coords_to_flat(coords):
+    """
+    Row-major pixel indices of (n, 2) coordinates. Negative coordinates wrap like edited[x, y] does, and
+    anything outside [-28, 28) raises ValueError, as indexing the image would.
+    """
+    if not ((coords >= -HEIGHT) & (coords < HEIGHT)).all():
+        raise ValueError(f"drawn_coords must lie within [-{HEIGHT}, {HEIGHT})")
+    return (coords[:, 0] % HEIGHT) * WIDTH + coords[:, 1] % WIDTH
+
+def coords_to_mask(drawn_coords):
+    """(784,) bool mask of a flat drawn_coords list."""
+    mask = torch.zeros(NUM_PIXELS, dtype=torch.bool)
+    mask[coords_to_flat(torch.tensor(drawn_coords, dtype=torch.long).view(-1, 2))] = True
+    return mask
+
+def encode_bitmap(mask):
+    """Packs a (784,) bool mask into a "bitmap:..." stroke."""
+    bits = mask.reshape(-1, 8).to(torch.uint8) << _BIT_SHIFTS
+    return "bitmap:" + base64.b64encode(bytes(bits.sum(dim=1, dtype=torch.uint8).tolist())).decode()
+
+def encode_rle(mask):
+    """Turns a (784,) bool mask into an "rle:..." stroke."""
+    padded = torch.cat([torch.zeros(1, dtype=torch.long), mask.long(), torch.zeros(1, dtype=torch.long)])
+    changes = torch.nonzero(padded[1:] != padded[:-1]).view(-1, 2)
+    runs = torch.stack([changes[:, 0], changes[:, 1] - changes[:, 0]], dim=1)
+    return "rle:" + ",".join(str(v) for v in runs.reshape(-1).tolist())
@@ -0,0 +1,62 @@
+import json
+import os
+import numpy as np
+from guess_cache import normalize_guess
+
+# Column layout of the atlas array
+PROJECTION_X, PROJECTION_Y, FEATURE_ACTIVATION = 0, 1, 2
+
+class Atlas:
+    """
+    Precomputed projections and feature activations for a word list (see build_atlas.py).
+
+    The values live in a memory-mapped float32 array of shape (num_words, 3) next to a JSON index,
+    so known words are answered without running the model and hint lookups are a vectorized scan.
+    """
+    def __init__(self, directory):
+        with open(os.path.join(directory, "index.json")) as f:
+            index = json.load(f)
+        self.namespace = index["namespace"]
+        self.words = index["words"]
+        self.positions = {word: i for i, word in enumerate(self.words)}
+        self.values = np.load(os.path.join(directory, "values.npy"), mmap_mode="r")
+        # words ordered by how strongly they activate the target feature, for "warmer" hints
+        self.by_activation = np.argsort(-self.values[:, FEATURE_ACTIVATION], kind="stable")
+
+    @classmethod
+    def load(cls, directory, namespace):
+        """The atlas in directory if it exists and was built for namespace, otherwise None."""
+        if not os.path.exists(os.path.join(directory, "index.json")):
+            return None
+        atlas = cls(directory)
+        if atlas.namespace != namespace:
+            print(f"Ignoring atlas built for {atlas.namespace}, expected {namespace}")
+            return None
+        return atlas
+
+    def lookup(self, guess):
+        i = self.positions.get(normalize_guess(guess))
+        if i is None:
+            return None
+        row = self.values[i]
+        return {
+            "projection": [float(row[PROJECTION_X]), float(row[PROJECTION_Y])],
+            "feature_activation": float(row[FEATURE_ACTIVATION]),
+        }
+
+    def nearest(self, projection, k=5, exclude=None):
+        """The k known words closest to projection in PCA space."""
+        if k <= 0 or not self.words:
+            return []
+        distances = ((self.values[:, :2] - np.asarray(projection, dtype=np.float32)) ** 2).sum(axis=1)
+        # one spare candidate in case the guess itself is among the nearest
+        num_candidates = min(k + 1, len(self.words))
+        candidates = np.argpartition(distances, num_candidates - 1)[:num_candidates]
+        candidates = candidates[np.argsort(distances[candidates], kind="stable")]
+        return [self.words[i] for i in candidates if self.words[i] != exclude][:k]
+
+    def strongest(self, k=5):
+        """The k known words that activate the target feature most."""
+        if k <= 0:
+            return []
+        return [self.words[i] for i in self.by_activation[:k]]
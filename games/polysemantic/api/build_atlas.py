@@ -0,0 +1,59 @@
+"""
+Builds the vocabulary atlas served by Predictor: the PCA projection and target feature activation of
+every word in a word list, computed offline in batches with the same model, SAE and PCA as predict.py.
+
+    python build_atlas.py --words words.txt --out atlas [--batch-size 64]
+
+The word list has one word (or short phrase) per line. Point ATLAS_DIR at the output directory.
+"""
+import argparse
+import json
+import os
+import numpy as np
+import torch
+from atlas import FEATURE_ACTIVATION, PROJECTION_X, PROJECTION_Y
+from guess_cache import normalize_guess
+from predict import Predictor
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--words", type=str, required=True)
+    parser.add_argument("--out", type=str, default="atlas")
+    parser.add_argument("--batch-size", type=int, default=64)
+    return parser.parse_args()
+
+def read_words(path):
+    """Normalized, de-duplicated words of the list, in file order."""
+    with open(path) as f:
+        words = [normalize_guess(line) for line in f]
+    return list(dict.fromkeys(word for word in words if word))
+
+def build_values(predictor, words, batch_size):
+    """(len(words), 3) float32 array of projections and feature activations."""
+    values = np.empty((len(words), 3), dtype=np.float32)
+    for start in range(0, len(words), batch_size):
+        activations = predictor.residuals(words[start:start + batch_size])
+        projection = predictor.readouts.primary.project(activations).float().cpu().numpy()
+        feature_activation = predictor.readouts.primary.feature_activations(activations)[:, 0].float().cpu().numpy()
+        values[start:start + len(projection), PROJECTION_X] = projection[:, 0]
+        values[start:start + len(projection), PROJECTION_Y] = projection[:, 1]
+        values[start:start + len(projection), FEATURE_ACTIVATION] = feature_activation
+        print(f"{min(start + batch_size, len(words))}/{len(words)} words")
+    return values
+
+if __name__ == "__main__":
+    args = get_args()
+    predictor = Predictor()
+    predictor.setup()
+    if not predictor.readouts.single_feature or predictor.readouts.primary.pca_path is None:
+        raise SystemExit("The atlas stores one feature and one projection; use a single-layer, single-feature config with a PCA")
+
+    words = read_words(args.words)
+    with torch.no_grad():
+        values = build_values(predictor, words, args.batch_size)
+
+    os.makedirs(args.out, exist_ok=True)
+    np.save(os.path.join(args.out, "values.npy"), values)
+    with open(os.path.join(args.out, "index.json"), "w") as f:
+        json.dump({"namespace": predictor.namespace, "words": words}, f)
+    print(f"Wrote {len(words)} words to {args.out}")
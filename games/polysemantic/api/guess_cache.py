@@ -0,0 +1,75 @@
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+
+def normalize_guess(guess):
+    """Players type the same word with different casing and spacing; they all map to one cache entry."""
+    return " ".join(guess.split()).lower()
+
+class GuessCache:
+    """
+    Two-tier cache of guess results: an in-memory LRU in front of an optional SQLite file that survives restarts.
+
+    namespace identifies everything the result depends on besides the guess (model, hook point, SAE,
+    feature index, PCA parameters), so changing any of them never serves stale results from the disk tier.
+    """
+    def __init__(self, namespace, max_entries=4096, disk_path=None):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.db = None
+        if disk_path:
+            self.db = sqlite3.connect(disk_path, check_same_thread=False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS guesses (key TEXT PRIMARY KEY, result TEXT)")
+            self.db.commit()
+
+    def _key(self, guess, variant=""):
+        key = f"{self.namespace}|{normalize_guess(guess)}"
+        return f"{key}|{variant}" if variant else key
+
+    def _remember(self, key, result):
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get(self, guess, variant=""):
+        """variant separates results of the same guess that differ in what was asked for, such as the hook points."""
+        key = self._key(guess, variant)
+        with self.lock:
+            if key in self.entries:
+                self.memory_hits += 1
+                self.entries.move_to_end(key)
+                return self.entries[key]
+            if self.db is not None:
+                row = self.db.execute("SELECT result FROM guesses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self.disk_hits += 1
+                    result = json.loads(row[0])
+                    self._remember(key, result)
+                    return result
+            self.misses += 1
+            return None
+
+    def put(self, guess, result, variant=""):
+        key = self._key(guess, variant)
+        with self.lock:
+            self._remember(key, result)
+            if self.db is not None:
+                self.db.execute("INSERT OR REPLACE INTO guesses (key, result) VALUES (?, ?)", (key, json.dumps(result)))
+                self.db.commit()
+
+    def stats(self):
+        total = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / total if total else 0.0,
+            "entries": len(self.entries),
+        }
@@ -0,0 +1,241 @@
+"""
+Per-request stage timing and memory, shared by the game Predictors.
+
+    with instrumentation.request("polysemantic", batch_size=1):
+        with instrumentation.stage("tokenize"):
+            ...
+
+Stages record wall time on the request active in the current thread and are no-ops outside one, so library
+code such as model.steer_token_activations_logits can mark stages without being told about requests.
+Every finished request updates process-wide Prometheus histograms (METRICS.prometheus(), served on
+METRICS_PORT by serve_metrics) and, if TRACE_PATH is set, appends one JSON line to that file.
+
+Only perf_counter calls happen per stage, so it is cheap enough to leave on; INSTRUMENTATION=0 turns it off.
+CUDA kernels run asynchronously, so without INSTRUMENTATION_SYNC=1 GPU time lands in the stage that next
+waits on the device (usually the host copy). Peak memory is the high-water mark reached during the request:
+torch.cuda.max_memory_allocated on GPU and the VmHWM peak RSS on Linux CPUs (reset through /proc/self/clear_refs),
+None where it cannot be reset. The mark is process-wide, so it is only reset when no other request is in flight;
+a request overlapping others reports the peak since the earliest of them started.
+
+This file is identical in every games/*/api directory, since each is deployed on its own.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import torch
+
+ENABLED = os.environ.get("INSTRUMENTATION", "1") != "0"
+SYNC = os.environ.get("INSTRUMENTATION_SYNC", "0") == "1"
+TRACE_PATH = os.environ.get("TRACE_PATH")
+
+# upper bounds in seconds of the histogram buckets, as Prometheus "le" labels
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+_current = contextvars.ContextVar("instrumentation_request", default=None)
+
+class RequestTrace:
+    def __init__(self, service, batch_size):
+        self.service = service
+        self.batch_size = batch_size
+        self.stages = {}
+        self.start = time.perf_counter()
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            yield f'{name}_bucket{{{labels},le="{le}"}} {cumulative}'
+        yield f"{name}_sum{{{labels}}} {self.sum}"
+        yield f"{name}_count{{{labels}}} {self.count}"
+
+class Metrics:
+    """Process-wide aggregates of every finished request, by service and stage."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stage_seconds = {}
+        self.request_seconds = {}
+        self.batch_sizes = {}
+        self.peak_memory = {}
+
+    def observe(self, trace, total, peak_memory):
+        with self.lock:
+            for stage, seconds in trace.stages.items():
+                self.stage_seconds.setdefault((trace.service, stage), Histogram()).observe(seconds)
+            self.request_seconds.setdefault(trace.service, Histogram()).observe(total)
+            batch_sum, batch_count = self.batch_sizes.get(trace.service, (0, 0))
+            self.batch_sizes[trace.service] = (batch_sum + trace.batch_size, batch_count + 1)
+            if peak_memory is not None:
+                self.peak_memory[trace.service] = max(self.peak_memory.get(trace.service, 0), peak_memory)
+
+    def prometheus(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            lines += ["# HELP carnival_stage_seconds Wall time of one request stage.", "# TYPE carnival_stage_seconds histogram"]
+            for (service, stage), histogram in sorted(self.stage_seconds.items()):
+                lines += histogram.lines("carnival_stage_seconds", f'service="{service}",stage="{stage}"')
+            lines += ["# HELP carnival_request_seconds Wall time of a whole request.", "# TYPE carnival_request_seconds histogram"]
+            for service, histogram in sorted(self.request_seconds.items()):
+                lines += histogram.lines("carnival_request_seconds", f'service="{service}"')
+            lines += ["# HELP carnival_batch_size Rows per request.", "# TYPE carnival_batch_size summary"]
+            for service, (batch_sum, batch_count) in sorted(self.batch_sizes.items()):
+                lines += [f'carnival_batch_size_sum{{service="{service}"}} {batch_sum}', f'carnival_batch_size_count{{service="{service}"}} {batch_count}']
+            lines += ["# HELP carnival_peak_memory_bytes Highest per-request peak memory seen.", "# TYPE carnival_peak_memory_bytes gauge"]
+            for service, peak in sorted(self.peak_memory.items()):
+                lines.append(f'carnival_peak_memory_bytes{{service="{service}"}} {peak}')
+        return "\n".join(lines) + "\n"
+
+METRICS = Metrics()
+_trace_lock = threading.Lock()
+# requests currently measuring the shared high-water mark, and whether it could be reset when the first one began
+_memory_lock = threading.Lock()
+_measuring = 0
+_peak_resettable = False
+
+def _sync():
+    if SYNC and torch.cuda.is_available():
+        torch.cuda.synchronize()
+
+def _reset_peak_memory():
+    """Restarts the high-water mark _peak_memory reads; False where that is not possible."""
+    if torch.cuda.is_available():
+        torch.cuda.reset_peak_memory_stats()
+        return True
+    try:
+        # "5" resets VmHWM to the current RSS (Linux only)
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def _peak_memory():
+    if torch.cuda.is_available():
+        return torch.cuda.max_memory_allocated()
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    # reported in kB
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def _start_peak_memory():
+    global _measuring, _peak_resettable
+    with _memory_lock:
+        if _measuring == 0:
+            _peak_resettable = _reset_peak_memory()
+        _measuring += 1
+
+def _stop_peak_memory():
+    global _measuring
+    with _memory_lock:
+        _measuring -= 1
+        return _peak_memory() if _peak_resettable else None
+
+@contextmanager
+def request(service, batch_size=1):
+    """Traces one request of service; stages inside it, in this thread, are recorded on it."""
+    if not ENABLED:
+        yield None
+        return
+    trace = RequestTrace(service, batch_size)
+    token = _current.set(trace)
+    _start_peak_memory()
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+        _sync()
+        total = time.perf_counter() - trace.start
+        peak_memory = _stop_peak_memory()
+        METRICS.observe(trace, total, peak_memory)
+        if TRACE_PATH:
+            record = {
+                "service": service,
+                "time": time.time(),
+                "batch_size": trace.batch_size,
+                "total_s": total,
+                "stages": trace.stages,
+                "peak_memory_bytes": peak_memory,
+            }
+            with _trace_lock, open(TRACE_PATH, "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+@contextmanager
+def stage(name):
+    """Adds the wall time of the block to stage name of the current request, if there is one."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    _sync()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _sync()
+        trace.add(name, time.perf_counter() - start)
+
+def add(name, seconds):
+    """Adds seconds measured elsewhere (e.g. inside hooks) to stage name of the current request."""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, seconds)
+
+def active():
+    return _current.get() is not None
+
+def set_batch_size(batch_size):
+    trace = _current.get()
+    if trace is not None:
+        trace.batch_size = batch_size
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        payload = METRICS.prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+_server = None
+
+def serve_metrics(port):
+    """Serves GET /metrics on port from a daemon thread; once per process, and not at all for port 0."""
+    global _server
+    if not port or _server is not None:
+        return
+    _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=_server.serve_forever, daemon=True).start()
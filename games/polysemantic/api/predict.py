@@ -4,61 +4,143 @@
 from cog import BasePredictor, Input, Path
 from typing import List
 from transformer_lens import HookedTransformer
-from sae_lens import SAE
 import torch
 from transformers import AutoTokenizer
 from dotenv import load_dotenv
-import pickle
+import os
+from guess_cache import GuessCache, normalize_guess
+from readout import MultiReadout, SAERegistry, hook_point_block, load_config
+from atlas import Atlas
+import instrumentation
 
 load_dotenv()
 
 class Predictor(BasePredictor):
     def setup(self) -> None:
         """Load the model into memory to make running multiple predictions efficient"""
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.layer = 12
-        self.model = HookedTransformer.from_pretrained("gemma-2-2b", device=self.device)
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        model = HookedTransformer.from_pretrained("gemma-2-2b", device=device)
+        tokenizer = AutoTokenizer.from_pretrained("google/gemma-2-2b")
 
-        # get hook point
-        self.hook_point = f"blocks.{self.layer}.hook_resid_post"
-        self.tokenizer = AutoTokenizer.from_pretrained("google/gemma-2-2b")
+        # Layers, SAEs, features and PCAs to read; set READOUT_CONFIG to a JSON config for other rounds.
+        # SAEs and PCAs are loaded on first use and shared between layers that name the same one
+        registry = SAERegistry(device)
+        self.prepare("gemma-2-2b", model, tokenizer, load_config(os.environ.get("READOUT_CONFIG")), registry)
 
-        # Get SAE
-        self.sae, cfg_dict, _ = SAE.from_pretrained(
-        release="gemma-2-2b-res-matryoshka-dc", sae_id=f"blocks.{self.layer}.hook_resid_post")
-        self.sae = self.sae.to(self.device)
+    def prepare(self, model_name, model, tokenizer, layers, registry):
+        """Everything setup derives from the model and the readout config; benchmarks call it with stand-ins"""
+        self.device = registry.device
+        self.model = model
+        self.tokenizer = tokenizer
+        self.registry = registry
+        self.readouts = MultiReadout(layers, registry)
+        self.hook_point = self.readouts.primary.hook_point
 
-        # Feature index
-        self.feature_index = 1644 # water feature
+        # Cache of guess results; set GUESS_CACHE_PATH to keep them across restarts
+        self.namespace = f"{model_name}|{self.readouts.namespace}"
+        self.cache = GuessCache(self.namespace, disk_path=os.environ.get("GUESS_CACHE_PATH"))
 
-        # load pca
-        with open('pca_model.pkl', 'rb') as f:
-            self.pca = pickle.load(f)
+        # Precomputed answers for known words, built offline with build_atlas.py; the atlas stores a single
+        # feature and projection, so it only answers single-feature configs
+        self.atlas = None
+        if self.readouts.single_feature:
+            self.atlas = Atlas.load(os.environ.get("ATLAS_DIR", "atlas"), self.namespace)
+
+        # Load the primary SAE and PCA and check them on a real activation before the first request
+        self.readouts.primary(self.residual("water"))
+        instrumentation.serve_metrics(int(os.environ.get("METRICS_PORT", 0)))
+
+    def capture(self, input_ids, hook_points):
+        """
+        Caches only hook_points and stops the forward pass after the highest block they read from,
+        so later blocks and the unembedding are never computed
+        """
+        last_block = max(hook_point_block(hook_point) for hook_point in hook_points)
+        with torch.no_grad():
+            _, cache = self.model.run_with_cache(
+                input_ids, names_filter=list(hook_points), stop_at_layer=last_block + 1
+            )
+        return cache
+
+    def run(self, guess, hook_points):
+        """Activation cache of hook_points for the prompt of guess"""
+        prompt = f"Repeat exactly: {guess}"
+        with instrumentation.stage("tokenize"):
+            tokens = self.tokenizer(prompt, return_tensors="pt")
+        with instrumentation.stage("to_device"):
+            tokens = tokens.to(self.device)
+        with instrumentation.stage("forward"):
+            return self.capture(tokens["input_ids"], hook_points)
+
+    def residual(self, guess):
+        """Primary layer activations at the last position of the prompt for guess"""
+        return self.run(guess, [self.hook_point])[self.hook_point][0, -1, :]
+
+    def residuals(self, guesses):
+        """
+        Last-position primary layer activations for many guesses, shape (len(guesses), d_model). Prompts with
+        the same number of tokens run together, so batches need no padding and match single runs exactly
+        """
+        input_ids = [self.tokenizer(f"Repeat exactly: {guess}")["input_ids"] for guess in guesses]
+        by_length = {}
+        for i, ids in enumerate(input_ids):
+            by_length.setdefault(len(ids), []).append(i)
+
+        activations = torch.empty(len(guesses), self.model.cfg.d_model, device=self.device)
+        for indices in by_length.values():
+            batch = torch.tensor([input_ids[i] for i in indices], device=self.device)
+            cache = self.capture(batch, [self.hook_point])
+            activations[indices] = cache[self.hook_point][:, -1, :].to(activations.dtype)
+        return activations
 
     def predict(
         self,
         guess: str = Input(description="The word the player guessed"),
+        hints: int = Input(description="Number of nearest and strongest known words to return as hints", default=0),
+        hook_points: str = Input(description="Comma-separated configured hook points to read, all of them if empty", default=""),
     ) -> dict:
         """Run a single prediction on the model"""
-        # Tokenize the guess
-        prompt = f"Repeat exactly: {guess}"
-
-        tokens = self.tokenizer(prompt, return_tensors="pt").to(self.device)
-        input_ids = tokens["input_ids"]
+        with instrumentation.request("polysemantic"):
+            guess = normalize_guess(guess)
+            hook_points = [hook_point.strip() for hook_point in hook_points.split(",") if hook_point.strip()]
+            result = self.answer(guess, self.readouts.select(hook_points))
+        if hints and self.atlas is not None:
+            result = dict(result)
+            result["nearest_words"] = self.atlas.nearest(result["projection"], hints, exclude=guess)
+            result["strongest_words"] = self.atlas.strongest(hints)
+        return result
 
-        # Do inference with cache
-        logits, cache = self.model.run_with_cache(input_ids)
+    def cache_stats(self):
+        """Hit rate and size of the guess cache, for the gateway's /stats."""
+        return {"guess_cache": self.cache.stats()}
 
-        # Access the layer activations
-        layer_12_activations = cache[self.hook_point][0, -1, :]
+    def answer(self, guess, layers):
+        """
+        Every configured feature activation and projection of layers for a normalized guess, from the cache,
+        the atlas or one forward pass. The first layer's first feature and projection are also returned at
+        the top level, which is what the game client reads
+        """
+        variant = "" if layers == self.readouts.layers else ",".join(layer.hook_point for layer in layers)
+        with instrumentation.stage("cache"):
+            cached = self.cache.get(guess, variant)
+        if cached is not None:
+            return cached
 
-        sae_activations = self.sae.encode(layer_12_activations)
-        feature_activation = sae_activations[self.feature_index]
-        
-        pre_pca_activations = layer_12_activations.reshape(1, -1).detach().cpu()
-        
-        # Project the layer output vector into 2D
-        projection = self.pca.transform(pre_pca_activations)[0].tolist()
-        feature_activation = feature_activation.tolist()
+        with instrumentation.stage("atlas"):
+            known = self.atlas.lookup(guess) if self.atlas is not None else None
+        if known is not None:
+            readouts = [self.readouts.primary.result([known["feature_activation"]], known["projection"])]
+        else:
+            # Run the model up to the highest requested layer, caching only the requested hook points
+            cache = self.run(guess, list(dict.fromkeys(layer.hook_point for layer in layers)))
+            readouts = [layer(cache[layer.hook_point][0, -1, :]) for layer in layers]
 
-        return {"projection": projection, "feature_activation" : feature_activation}
+        first = readouts[0]
+        result = {
+            "projection": first["projection"],
+            "feature_activation": next(iter(first["features"].values())),
+            "readouts": readouts,
+        }
+        with instrumentation.stage("cache"):
+            self.cache.put(guess, result, variant)
+        return result
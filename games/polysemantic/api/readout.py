@@ -0,0 +1,263 @@
+import hashlib
+import json
+import os
+import pickle
+import re
+import threading
+import torch
+from sae_lens import SAE
+import instrumentation
+
+# The original game round: the water feature of the layer 12 residual SAE, projected with pca_model.pkl
+DEFAULT_CONFIG = {
+    "layers": [
+        {"layer": 12, "sae_release": "gemma-2-2b-res-matryoshka-dc", "features": [1644], "pca": "pca_model.pkl"},
+    ],
+}
+
+# Hook points inside a transformer block; the block index tells the capture pass where it can stop
+BLOCK_HOOK_POINT = re.compile(r"blocks\.(\d+)\.")
+
+def hook_point_block(hook_point):
+    """The index of the block hook_point reads from; ValueError for hook points outside the blocks."""
+    match = BLOCK_HOOK_POINT.match(hook_point)
+    if match is None:
+        raise ValueError(f"Hook point {hook_point} is not inside a transformer block (blocks.<n>.*)")
+    return int(match.group(1))
+
+def load_config(path=None):
+    """
+    Layer specs from a JSON readout config (or DEFAULT_CONFIG), each with hook_point, sae_release, sae_id,
+    features and pca. hook_point defaults to the residual stream after "layer", sae_id to the hook point.
+    """
+    config = DEFAULT_CONFIG
+    if path:
+        with open(path) as f:
+            config = json.load(f)
+    layers = []
+    for spec in config["layers"]:
+        spec = dict(spec)
+        if "hook_point" not in spec:
+            spec["hook_point"] = f"blocks.{spec['layer']}.hook_resid_post"
+        hook_point_block(spec["hook_point"])
+        spec.setdefault("sae_id", spec["hook_point"])
+        # relative PCA paths are resolved now, since they are only opened when a request first reads the layer
+        spec["pca"] = os.path.abspath(spec["pca"]) if spec.get("pca") else None
+        if not spec.get("features"):
+            raise ValueError(f"No features configured for {spec['hook_point']}")
+        layers.append(spec)
+    if not layers:
+        raise ValueError("The readout config needs at least one layer")
+    return layers
+
+class FeatureReadout:
+    """
+    Reads a few SAE features without running the full encoder: only the matching W_enc columns and
+    b_enc entries are kept, and the SAE's own activation function is applied to them.
+
+    This holds for element-wise activations (ReLU, JumpReLU). Activations that couple latents, such as
+    TopK, need every latent; check() catches those and callers should then fall back to sae.encode.
+    """
+    def __init__(self, sae, feature_indices):
+        self.sae = sae
+        self.feature_indices = torch.as_tensor(feature_indices, device=sae.W_enc.device)
+        with torch.no_grad():
+            self.W_enc = sae.W_enc[:, self.feature_indices].contiguous()
+            self.b_enc = sae.b_enc[self.feature_indices].contiguous()
+            threshold = getattr(sae, "threshold", None)
+            self.threshold = None if threshold is None else threshold[self.feature_indices].contiguous()
+
+    def _sae_in(self, x):
+        if hasattr(self.sae, "process_sae_in"):
+            return self.sae.process_sae_in(x)
+        return x - self.sae.b_dec * self.sae.cfg.apply_b_dec_to_input
+
+    @torch.no_grad()
+    def __call__(self, x):
+        """Activations of the selected features for residuals x of shape (..., d_in), shape (..., num_features)."""
+        x = x.to(self.W_enc.dtype)
+        hidden_pre = self._sae_in(x) @ self.W_enc + self.b_enc
+        activations = self.sae.activation_fn(hidden_pre)
+        if self.threshold is not None:
+            activations = activations * (hidden_pre > self.threshold)
+        return activations
+
+    @torch.no_grad()
+    def check(self, x, atol=1e-4):
+        """Whether this readout matches sae.encode on x for the selected features."""
+        expected = self.sae.encode(x.to(self.W_enc.dtype))[..., self.feature_indices]
+        return torch.allclose(self(x), expected, atol=atol, rtol=1e-4)
+
+class TorchPCA:
+    """
+    sklearn PCA.transform as a mean and a (d_in, n_components) projection kept on the model device,
+    so projecting a residual needs no host round-trip and no sklearn at request time.
+    """
+    def __init__(self, pca, device, dtype=torch.float32):
+        projection = torch.as_tensor(pca.components_.T, dtype=torch.float64)
+        if getattr(pca, "whiten", False):
+            projection = projection / torch.as_tensor(pca.explained_variance_, dtype=torch.float64).sqrt()
+        self.mean = torch.as_tensor(pca.mean_, dtype=torch.float64).to(device, dtype)
+        self.projection = projection.to(device, dtype)
+
+    @torch.no_grad()
+    def __call__(self, x):
+        """Projects x of shape (..., d_in) to (..., n_components)."""
+        return (x.to(self.projection.dtype) - self.mean) @ self.projection
+
+class SklearnPCA:
+    """pca.transform behind the TorchPCA interface, for when the on-device projection does not match it."""
+    def __init__(self, pca, device):
+        self.pca = pca
+        self.device = device
+
+    @torch.no_grad()
+    def __call__(self, x):
+        flat = x.reshape(-1, x.shape[-1]).detach().float().cpu().numpy()
+        projection = torch.as_tensor(self.pca.transform(flat), dtype=torch.float32)
+        return projection.reshape(*x.shape[:-1], -1).to(self.device)
+
+def pca_matches(pca, torch_pca, x, atol=1e-3):
+    """Whether torch_pca matches pca.transform on x of shape (..., d_in)."""
+    flat = x.reshape(-1, x.shape[-1])
+    expected = torch.as_tensor(pca.transform(flat.detach().float().cpu().numpy()), dtype=torch.float32)
+    return torch.allclose(torch_pca(flat).float().cpu(), expected, atol=atol, rtol=1e-3)
+
+class SAERegistry:
+    """
+    Loads each SAE and PCA at most once, on first use, and hands the same object to every readout that
+    asks for it, so rounds sharing an SAE or a PCA never hold duplicate weights.
+    """
+    def __init__(self, device):
+        self.device = device
+        self.saes = {}
+        self.pcas = {}
+        self.lock = threading.Lock()
+
+    def sae(self, release, sae_id):
+        with self.lock:
+            if (release, sae_id) not in self.saes:
+                sae, _, _ = SAE.from_pretrained(release=release, sae_id=sae_id)
+                self.saes[release, sae_id] = sae.to(self.device)
+            return self.saes[release, sae_id]
+
+    def pca(self, path):
+        """The unpickled sklearn PCA at path and its TorchPCA."""
+        with self.lock:
+            if path not in self.pcas:
+                with open(path, "rb") as f:
+                    pca = pickle.load(f)
+                self.pcas[path] = (pca, TorchPCA(pca, self.device))
+            return self.pcas[path]
+
+    def pca_fingerprint(self, path):
+        """Short hash of the fitted parameters of the PCA at path, so a retrained PCA gets a new identity."""
+        pca, _ = self.pca(path)
+        digest = hashlib.sha1()
+        arrays = [pca.components_, pca.mean_]
+        if getattr(pca, "whiten", False):
+            arrays.append(pca.explained_variance_)
+        for array in arrays:
+            digest.update(array.tobytes())
+        return digest.hexdigest()[:12]
+
+class LayerReadout:
+    """
+    Configured features and projection of one hook point. The SAE and PCA are fetched from the registry
+    on the first call, and the fast readout and projection are checked against sae.encode and
+    pca.transform on that first real activation before they are trusted; either falls back to the
+    reference implementation when it disagrees.
+    """
+    def __init__(self, spec, registry):
+        self.hook_point = spec["hook_point"]
+        self.sae_release = spec["sae_release"]
+        self.sae_id = spec["sae_id"]
+        self.features = list(spec["features"])
+        self.pca_path = spec["pca"]
+        self.registry = registry
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    @property
+    def namespace(self):
+        """Everything besides the guess that this layer's results depend on, including the PCA's fitted parameters."""
+        sae = self.sae_release if self.sae_id == self.hook_point else f"{self.sae_release}/{self.sae_id}"
+        namespace = f"{self.hook_point}|{sae}|{','.join(map(str, self.features))}"
+        if self.pca_path:
+            namespace += f"|pca:{self.registry.pca_fingerprint(self.pca_path)}"
+        return namespace
+
+    def _load(self, activations):
+        self.sae = self.registry.sae(self.sae_release, self.sae_id)
+        self.readout = FeatureReadout(self.sae, self.features)
+        self.single_feature_readout = self.readout.check(activations)
+        if not self.single_feature_readout:
+            print(f"Single-feature SAE readout does not match sae.encode for {self.hook_point}; using the full encoder")
+        self.torch_pca = None
+        if self.pca_path:
+            pca, self.torch_pca = self.registry.pca(self.pca_path)
+            if not pca_matches(pca, self.torch_pca, activations):
+                print(f"On-device PCA does not match pca.transform for {self.hook_point}; using sklearn")
+                self.torch_pca = SklearnPCA(pca, self.registry.device)
+
+    def ensure_loaded(self, activations):
+        if not self.loaded:
+            with self.lock:
+                if not self.loaded:
+                    with instrumentation.stage("load_sae"):
+                        self._load(activations)
+                    self.loaded = True
+
+    def feature_activations(self, activations):
+        """Configured feature activations for layer activations of shape (..., d_model), shape (..., num_features)."""
+        self.ensure_loaded(activations)
+        if self.single_feature_readout:
+            return self.readout(activations)
+        with torch.no_grad():
+            return self.sae.encode(activations.to(self.readout.W_enc.dtype))[..., self.readout.feature_indices]
+
+    def project(self, activations):
+        """PCA projection of shape (..., n_components), or None if this layer has no PCA."""
+        self.ensure_loaded(activations)
+        return None if self.torch_pca is None else self.torch_pca(activations)
+
+    def result(self, feature_activations, projection):
+        return {
+            "hook_point": self.hook_point,
+            "features": dict(zip(map(str, self.features), feature_activations)),
+            "projection": projection,
+        }
+
+    def __call__(self, activations):
+        """Result entry for the layer activations of one prompt position, shape (d_model,)."""
+        with instrumentation.stage("sae_encode"):
+            feature_activations = self.feature_activations(activations)
+        with instrumentation.stage("pca"):
+            projection = self.project(activations)
+        with instrumentation.stage("readback"):
+            return self.result(feature_activations.tolist(), None if projection is None else projection.tolist())
+
+class MultiReadout:
+    """All configured layer readouts; any subset of them is read from the hook points of one forward pass."""
+    def __init__(self, layers, registry):
+        self.layers = [LayerReadout(spec, registry) for spec in layers]
+        self.primary = self.layers[0]
+        self.hook_points = list(dict.fromkeys(layer.hook_point for layer in self.layers))
+
+    @property
+    def namespace(self):
+        return ";".join(layer.namespace for layer in self.layers)
+
+    @property
+    def single_feature(self):
+        """Whether the config is one layer with one feature, the layout the vocabulary atlas stores."""
+        return len(self.layers) == 1 and len(self.primary.features) == 1
+
+    def select(self, hook_points=None):
+        """Readouts of the requested hook points (all of them by default), in config order."""
+        if not hook_points:
+            return self.layers
+        unknown = set(hook_points) - set(self.hook_points)
+        if unknown:
+            raise ValueError(f"Hook points {sorted(unknown)} are not configured, expected some of {self.hook_points}")
+        return [layer for layer in self.layers if layer.hook_point in hook_points]
@@ -0,0 +1,188 @@
+"""
+Attribution patching for choosing knobs: estimates, for every down_proj input neuron (the MLP neurons the
+Transluce labels describe) at every position, how much zero-ablating it would change the log-prob of a
+target token, from one forward and one backward pass per prompt batch. The estimate is the first-order
+term -gradient * activation; the strongest candidates can then be confirmed with exact ablations, batched
+along the batch dimension on top of the cached baseline residual stream.
+
+Candidates index down_proj's input, not the hidden-size outputs the default knobs act on, so they are
+offered as knobs with site "input" (see steering.INPUT and to_knob_turns).
+
+    python attribution.py --prompt "Convince me why I shouldn't go swimming in the ocean." --target " Because" \
+        --top-k 10 --verify 32 [--model ...]
+"""
+import argparse
+import json
+from collections import namedtuple
+import torch
+import torch.nn.functional as F
+import engine
+import model
+import steering
+
+# One ranked neuron: estimated (and, once verified, exact) change of the target log-prob when zeroed
+Candidate = namedtuple("Candidate", ["layer", "neuron", "token", "estimate", "exact"], defaults=[None])
+
+def _target_tensor(target_tokens, batch_size, device):
+    targets = torch.as_tensor(target_tokens, dtype=torch.long, device=device).reshape(-1)
+    return targets.expand(batch_size) if targets.numel() == 1 else targets
+
+def attribution_scores(model_a, batch, target_tokens, resumable, module_str_dict=model.DEFAULT_MODULE_STR_DICT, top_k=10):
+    """
+    Top-k down_proj input neurons by estimated effect, for every layer and position of every prompt.
+
+    target_tokens is one token id for all prompts or one per prompt, scored at each prompt's last non-pad
+    position. Returns a dict with
+        "neurons":   (n_layers, batch, seq_len, top_k) neuron indices, strongest |effect| first
+        "effects":   (n_layers, batch, seq_len, top_k) estimated log-prob change when the neuron is zeroed
+        "log_probs": (batch,) baseline log-probs of the targets
+    Positions index the padded batch, like knob tokens; pad positions get zero effect.
+    """
+    n_layers = resumable.n_layers
+    batch_size = batch["input_ids"].shape[0]
+    positions = model.get_last_positions(batch["attention_mask"])
+    targets = _target_tensor(target_tokens, batch_size, positions.device)
+    activations = [None] * n_layers
+
+    def get_pre_hook(layer_idx):
+        def pre_hook(module, inputs):
+            activations[layer_idx] = inputs[0]
+        return pre_hook
+
+    def require_grad(module, inputs, output):
+        # frozen weights would leave nothing to differentiate; start the graph at the embeddings instead
+        if not output.requires_grad:
+            output.requires_grad_()
+
+    handles = [
+        engine.resolve_module(model_a, module_str_dict["down_proj"], layer_idx=i).register_forward_pre_hook(get_pre_hook(i))
+        for i in range(n_layers)
+    ]
+    handles.append(model_a.get_input_embeddings().register_forward_hook(require_grad))
+    model_a.eval()
+    try:
+        with torch.enable_grad():
+            hidden = model_a.base_model(**batch, use_cache=False).last_hidden_state
+            rows = torch.arange(batch_size, device=hidden.device)
+            # the final norm is already applied by the base model, so only the LM head remains
+            logits = resumable._softcap(resumable.lm_head(hidden[rows, positions.to(hidden.device)])).float()
+            log_probs = F.log_softmax(logits, dim=-1)[rows, targets.to(logits.device)]
+            # prompts are independent, so one backward of the sum gives every prompt its own gradients
+            gradients = torch.autograd.grad(log_probs.sum(), activations)
+    finally:
+        for handle in handles:
+            handle.remove()
+
+    pad = batch["attention_mask"] == 0
+    neurons, effects = [], []
+    with torch.no_grad():
+        for activation, gradient in zip(activations, gradients):
+            effect = -(gradient.float() * activation.float())
+            effect[pad.to(effect.device)] = 0
+            top = effect.abs().topk(min(top_k, effect.shape[-1]), dim=-1).indices
+            neurons.append(top)
+            effects.append(effect.gather(-1, top))
+    return {"neurons": torch.stack(neurons), "effects": torch.stack(effects), "log_probs": log_probs.detach()}
+
+def top_candidates(scores, row=0, count=20):
+    """The count strongest (layer, neuron, token) candidates of one prompt across all layers and positions."""
+    effects = scores["effects"][:, row]
+    flat = effects.abs().reshape(-1).topk(min(count, effects.numel())).indices
+    n_layers, seq_len, top_k = effects.shape
+    layers, tokens, ranks = flat // (seq_len * top_k), flat // top_k % seq_len, flat % top_k
+    neurons = scores["neurons"][:, row][layers, tokens, ranks]
+    return [
+        Candidate(layer, neuron, token, estimate)
+        for layer, neuron, token, estimate in zip(
+            layers.tolist(), neurons.tolist(), tokens.tolist(), effects[layers, tokens, ranks].tolist()
+        )
+    ]
+
+def ablation(candidate):
+    """The input-site Intervention that zeroes candidate, as SteeringHooks applies it."""
+    return steering.Intervention(candidate.layer, candidate.neuron, candidate.token, "set", 0.0, steering.INPUT)
+
+def to_knob_turns(candidates, amount=1.0, op="scale"):
+    """knob_turns JSON for Predictor.predict offering candidates as input-site knobs, all set to amount."""
+    return json.dumps([
+        {"layer": c.layer, "neuron": c.neuron, "token": c.token, "amount": amount, "op": op, "site": steering.INPUT}
+        for c in candidates
+    ])
+
+@torch.no_grad()
+def verify_candidates(model_a, batch, candidates, target_token, resumable, module_str_dict=model.DEFAULT_MODULE_STR_DICT, row=0, memory_budget_mb=None):
+    """
+    Exact log-prob change of target_token when each candidate of prompt row is zeroed on its own. Each
+    candidate is one row of a batched pass that resumes from the cached baseline at the lowest layer of
+    its chunk, with its ablation() applied to that row only, through the same input-site hooks that
+    serve the candidate as a knob. Returns the candidates with exact filled in, in the given order.
+    """
+    single = {k: v[row:row + 1] for k, v in batch.items()}
+    positions = model.get_last_positions(single["attention_mask"])
+    cache = resumable.run_baseline(single, full_logits=False)
+    baseline, _ = resumable.score(resumable.resume_last_hidden(cache, resumable.n_layers, positions), [target_token])
+
+    hooks = steering.SteeringHooks(model_a, module_str_dict, resumable.n_layers)
+    # chunks of neighbouring layers resume from a shared, high start layer
+    order = sorted(range(len(candidates)), key=lambda i: candidates[i].layer)
+    chunk_size = model.get_chunk_steps(model_a, single, len(candidates), memory_budget_mb, full_logits=False)
+    exact = [None] * len(candidates)
+    try:
+        for start in range(0, len(order), chunk_size):
+            chunk = [candidates[i] for i in order[start:start + chunk_size]]
+            hooks.activate(steering.SteeringPlan([ablation(c) for c in chunk], rows=list(range(len(chunk)))))
+            try:
+                hidden = resumable.resume_last_hidden(cache, chunk[0].layer, positions, repeats=len(chunk))
+            finally:
+                hooks.deactivate()
+            log_probs, _ = resumable.score(hidden, [target_token])
+            for i, change in zip(order[start:start + chunk_size], (log_probs[:, 0] - baseline[0, 0]).tolist()):
+                exact[i] = change
+    finally:
+        hooks.remove()
+    return [candidate._replace(exact=change) for candidate, change in zip(candidates, exact)]
+
+def rank_neurons(model_a, tokenizer, input_strings, target_tokens, resumable, module_str_dict=model.DEFAULT_MODULE_STR_DICT, top_k=10, verify=0, memory_budget_mb=None, prompt_cache=None):
+    """
+    Attribution scores for input_strings and, with verify > 0, the verify strongest candidates of every
+    prompt checked by exact ablation. Returns the scores dict with "candidates" added: one list per prompt.
+    """
+    batch = model.tokenize_prompts(model_a, tokenizer, input_strings, prompt_cache)
+    if batch is None:
+        return None
+    scores = attribution_scores(model_a, batch, target_tokens, resumable, module_str_dict, top_k)
+    targets = _target_tensor(target_tokens, len(input_strings), "cpu").tolist()
+    scores["candidates"] = []
+    for row in range(len(input_strings)):
+        candidates = top_candidates(scores, row, verify or top_k)
+        if verify:
+            candidates = verify_candidates(model_a, batch, candidates, targets[row], resumable, module_str_dict, row, memory_budget_mb)
+        scores["candidates"].append(candidates)
+    return scores
+
+def get_tool_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--prompt", type=str, action="append", required=True)
+    parser.add_argument("--target", type=str, required=True, help="Target token text, e.g. ' Because'")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--verify", type=int, default=0, help="Strongest candidates per prompt to check by exact ablation")
+    parser.add_argument("--memory-budget-mb", type=int, default=None)
+    return parser.parse_known_args()
+
+if __name__ == "__main__":
+    tool_args, model_argv = get_tool_args()
+    args = model.get_args(model_argv)
+    model_a, tokenizer = model.load_model(args)
+    resumable = engine.LayerResumableEngine(model_a, args.module_str_dict, args.n_layers)
+    target = tokenizer.encode(tool_args.target, add_special_tokens=False)[0]
+
+    scores = rank_neurons(
+        model_a, tokenizer, tool_args.prompt, target, resumable, args.module_str_dict,
+        tool_args.top_k, tool_args.verify, tool_args.memory_budget_mb,
+    )
+    for prompt, candidates, log_prob in zip(tool_args.prompt, scores["candidates"], scores["log_probs"].tolist()):
+        print(f"{prompt!r}: log p({tool_args.target!r}) = {log_prob:.3f}")
+        for c in candidates:
+            exact = "" if c.exact is None else f"  exact {c.exact:+.4f}"
+            print(f"  layer {c.layer:>2} neuron {c.neuron:>5} token {c.token:>3}  estimate {c.estimate:+.4f}{exact}")
+        print(f"  as knobs: {to_knob_turns(candidates)}")
@@ -0,0 +1,178 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import torch
+import torch.nn.functional as F
+import model
+import steering
+
+class SteerRequest:
+    """One player's prompt and knobs, waiting to be run in a micro-batch."""
+    def __init__(self, input_string, neuron_list_to_steer, target_tokens):
+        self.input_string = input_string
+        self.neuron_list_to_steer = neuron_list_to_steer
+        self.target_tokens = list(target_tokens)
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+class MicroBatcher:
+    """
+    Request queue in front of the steered forward pass.
+
+    Concurrent requests are collected for up to max_wait_ms after the first one arrives, or until
+    max_batch_size are waiting, and run as one left-padded batch. Every intervention is tied to its
+    own request's row, so requests with different knobs share the pass without affecting each other.
+    Each caller gets back the next token and target log-probs for its own prompt.
+
+    The batcher is currently unused: neither Predictor.predict, which Cog calls one request at a time and
+    which has no prompt input yet, nor the gateway's /api/steer goes through it, and bench_batching.py is
+    its only caller. It also bypasses steer_token_activations_logits, the prompt cache and instrumentation.
+    It registers its own SteeringHooks and its worker thread must be the only one running model_a: other
+    hooks or passes on the same model from other threads would see or clobber its active plan.
+
+    A batch that fails is retried one request at a time, so one bad request only fails its own caller.
+    """
+    def __init__(self, model_a, tokenizer, module_str_dict, n_layers, max_batch_size=16, max_wait_ms=5.0):
+        self.model_a = model_a
+        self.tokenizer = tokenizer
+        self.hooks = steering.SteeringHooks(model_a, module_str_dict, n_layers)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        self.batch_sizes = []
+        self.queue_latencies = []
+        self._closed = False
+        self._lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, input_string, neuron_list_to_steer, target_tokens=()):
+        """
+        Queues a request and returns a Future resolving to {"next_token", "target_log_probs"}. Knobs are
+        checked against the model and the request's own prompt here, so a bad one raises ValueError in the
+        caller instead of reaching a shared batch.
+        """
+        prompt = model.format_prompts(self.tokenizer, [input_string])
+        self.hooks.check(neuron_list_to_steer, len(self.tokenizer(prompt)["input_ids"][0]))
+        vocab_size = self.model_a.config.vocab_size
+        if any(not 0 <= t < vocab_size for t in target_tokens):
+            raise ValueError(f"Target tokens must lie within [0, {vocab_size})")
+        request = SteerRequest(input_string, neuron_list_to_steer, target_tokens)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("MicroBatcher is closed")
+            self.queue.put(request)
+        return request.future
+
+    def steer(self, input_string, neuron_list_to_steer, target_tokens=()):
+        """Blocking version of submit."""
+        return self.submit(input_string, neuron_list_to_steer, target_tokens).result()
+
+    def close(self):
+        """
+        Stops accepting requests, runs every request queued so far and waits for the worker to stop.
+        The sentinel goes in after the last accepted request, so the worker only stops once it reaches it.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self.queue.put(None)
+        self._worker.join()
+        self.hooks.remove()
+
+    def _collect(self):
+        """The next micro-batch, and whether the close sentinel was reached while collecting it."""
+        first = self.queue.get()
+        if first is None:
+            return [], True
+        requests = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(requests) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                request = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                return requests, True
+            requests.append(request)
+        return requests, False
+
+    def _run(self):
+        done = False
+        while not done:
+            requests, done = self._collect()
+            # callers may have cancelled their futures while waiting; the rest can no longer be cancelled
+            requests = [r for r in requests if r.future.set_running_or_notify_cancel()]
+            if not requests:
+                continue
+            start = time.perf_counter()
+            self.batch_sizes.append(len(requests))
+            self.queue_latencies.extend(start - r.enqueued for r in requests)
+            try:
+                results = self.run_batch(requests)
+            except Exception as e:
+                if len(requests) == 1:
+                    requests[0].future.set_exception(e)
+                    continue
+                # find the culprit by running the batch's requests on their own
+                for request in requests:
+                    try:
+                        request.future.set_result(self.run_batch([request])[0])
+                    except Exception as e:
+                        request.future.set_exception(e)
+                continue
+            for request, result in zip(requests, results):
+                request.future.set_result(result)
+
+    @torch.no_grad()
+    def run_batch(self, requests):
+        prompts = model.format_prompts(self.tokenizer, [r.input_string for r in requests])
+        batch = self.tokenizer(prompts, return_tensors="pt", padding=True)
+        device = next(self.model_a.parameters()).device
+        batch = {k: v.to(device) for k, v in batch.items()}
+
+        # left padding shifts non-negative token positions by the row's pad length
+        pad = (batch["attention_mask"].shape[1] - batch["attention_mask"].sum(dim=-1)).tolist()
+        interventions, rows = [], []
+        for row, request in enumerate(requests):
+            for n in request.neuron_list_to_steer:
+                token = n.token + pad[row] if n.token >= 0 else n.token
+                interventions.append(steering.Intervention(
+                    n.layer, n.neuron, token, getattr(n, "op", "set"), getattr(n, "value", 0.0), getattr(n, "site", steering.OUTPUT)
+                ))
+                rows.append(row)
+        plan = steering.SteeringPlan(interventions, rows=rows)
+
+        self.model_a.eval()
+        self.hooks.activate(plan)
+        try:
+            logits = self.model_a(**batch).logits[:, -1]
+        finally:
+            self.hooks.deactivate()
+        log_probs = F.log_softmax(logits.float(), dim=-1)
+        next_token_ids = torch.argmax(logits, dim=-1).tolist()
+
+        return [
+            {
+                "next_token": self.tokenizer.decode([next_token_ids[row]]),
+                "target_log_probs": log_probs[row, request.target_tokens].tolist(),
+            }
+            for row, request in enumerate(requests)
+        ]
+
+    def stats(self):
+        latencies = sorted(self.queue_latencies)
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] if latencies else None
+        return {
+            "batches": len(self.batch_sizes),
+            "requests": sum(self.batch_sizes),
+            "mean_batch_size": sum(self.batch_sizes) / len(self.batch_sizes) if self.batch_sizes else 0.0,
+            "queue_latency_p50": percentile(50),
+            "queue_latency_p99": percentile(99),
+        }
@@ -0,0 +1,72 @@
+"""
+Measures throughput and queueing latency of MicroBatcher against one-request-at-a-time serving,
+using a tiny random Llama on CPU.
+
+    python bench_batching.py --clients 32 --requests-per-client 8 --max-batch-size 16 --max-wait-ms 5
+"""
+import argparse
+import random
+import threading
+import time
+import torch
+import batching
+import steering
+import tiny_model
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--requests-per-client", type=int, default=8)
+    parser.add_argument("--max-batch-size", type=int, default=16)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--knobs", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=4)
+    return parser.parse_args()
+
+def random_knobs(rng, n_layers, num_neurons, num_knobs):
+    return [
+        steering.Intervention(rng.randrange(n_layers), rng.randrange(num_neurons), -1, "scale", rng.uniform(0, 2))
+        for _ in range(num_knobs)
+    ]
+
+def run(batcher, args, prompts, n_layers, hidden_size):
+    latencies = []
+    lock = threading.Lock()
+
+    def client(client_idx):
+        rng = random.Random(client_idx)
+        for _ in range(args.requests_per_client):
+            knobs = random_knobs(rng, n_layers, hidden_size, args.knobs)
+            start = time.perf_counter()
+            batcher.steer(rng.choice(prompts), knobs, target_tokens=[0])
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(args.clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests_per_second": len(latencies) / elapsed,
+        "latency_p50_ms": 1000 * latencies[len(latencies) // 2],
+        "latency_p99_ms": 1000 * latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))],
+        **batcher.stats(),
+    }
+
+if __name__ == "__main__":
+    args = get_args()
+    torch.set_num_threads(args.threads)
+    model_a, tokenizer = tiny_model.load_tiny(args)
+    prompts = ["The ocean is deep and", "My favourite colour is", "Once upon a time there was a", "Water is wet because"]
+    # knobs act on down_proj outputs, so neuron indices range over the hidden size
+    hidden_size = model_a.config.hidden_size
+
+    for name, max_batch_size in [("sequential", 1), ("micro-batched", args.max_batch_size)]:
+        batcher = batching.MicroBatcher(model_a, tokenizer, args.module_str_dict, args.n_layers, max_batch_size, args.max_wait_ms)
+        result = run(batcher, args, prompts, args.n_layers, hidden_size)
+        batcher.close()
+        print(f"{name}: " + ", ".join(f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}" for k, v in result.items()))
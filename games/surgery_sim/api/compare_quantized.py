@@ -0,0 +1,114 @@
+"""
+Fidelity report for the int8 CPU model: runs the same prompts and knobs through the reference model
+and the --int8 model and compares what players would see. The main metric is the difference in absolute
+target log-probs, at the baseline and at every steering step: two models can shift a target by the same
+amount from different starting points, so matching log-prob changes alone would hide a drifted baseline.
+
+    python compare_quantized.py --prompt-set prompts.json --report int8_report.json [--model ...]
+
+The prompt set is a JSON list of {"prompt": str, "knobs": [{layer, neuron, token, amount[, op, site]}], "targets": [str]}.
+"knobs" and "targets" are optional; without targets the reference model's next token is scored.
+"""
+import argparse
+import gc
+import json
+import engine
+import model
+import steering
+
+DEFAULT_PROMPT_SET = [
+    {"prompt": "Convince me why I shouldn't go swimming in the ocean."},
+    {"prompt": "What is the capital of France?"},
+    {"prompt": "Write a short poem about rain."},
+]
+
+def get_tool_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--prompt-set", type=str, default=None)
+    parser.add_argument("--report", type=str, default="int8_report.json")
+    return parser.parse_known_args()
+
+def run_prompt_set(args, prompt_set):
+    """Runs every prompt of the set through the model described by args and collects next tokens and steering curves."""
+    model_a, tokenizer = model.load_model(args)
+    hooks = steering.SteeringHooks(model_a, args.module_str_dict, args.n_layers)
+    resumable = engine.LayerResumableEngine(model_a, args.module_str_dict, args.n_layers)
+    results = []
+    for item in prompt_set:
+        knobs = steering.parse_knob_turns(json.dumps(item.get("knobs", [])))
+        next_token = model.steer_token_activations_logits(
+            model_a, tokenizer, [item["prompt"]], knobs, 0, None, engine=resumable, hooks=hooks
+        )
+        targets = item.get("targets") or [next_token]
+        target_ids = [tokenizer.encode(t, add_special_tokens=False)[0] for t in targets]
+        scores = model.steer_token_activations_scores(
+            model_a, tokenizer, [item["prompt"]], knobs, target_ids, resumable, hooks
+        )
+        results.append({
+            "next_token": next_token,
+            "targets": targets,
+            "log_probs": scores["log_probs"][:, 0].tolist(),
+            "log_prob_changes": scores["log_prob_changes"][:, 0].tolist(),
+        })
+    hooks.remove()
+    del model_a, resumable
+    gc.collect()
+    return results
+
+def abs_diffs(reference, quantized, key):
+    """|reference - int8| for every step and target of every prompt, on the per-step lists stored under key."""
+    return [
+        abs(a - b)
+        for r, q in zip(reference, quantized)
+        for step_r, step_q in zip(r[key], q[key])
+        for a, b in zip(step_r, step_q)
+    ]
+
+def compare(reference, quantized):
+    agree = [r["next_token"] == q["next_token"] for r, q in zip(reference, quantized)]
+    log_prob_deltas = abs_diffs(reference, quantized, "log_probs")
+    baseline_deltas = [
+        abs(a - b) for r, q in zip(reference, quantized) for a, b in zip(r["log_probs"][0], q["log_probs"][0])
+    ]
+    change_deltas = abs_diffs(reference, quantized, "log_prob_changes")
+    return {
+        "prompts": len(agree),
+        "argmax_agreement": sum(agree) / len(agree) if agree else None,
+        "log_prob_mean_abs_diff": sum(log_prob_deltas) / len(log_prob_deltas) if log_prob_deltas else None,
+        "log_prob_max_abs_diff": max(log_prob_deltas) if log_prob_deltas else None,
+        "baseline_log_prob_max_abs_diff": max(baseline_deltas) if baseline_deltas else None,
+        "log_prob_change_mean_abs_diff": sum(change_deltas) / len(change_deltas) if change_deltas else None,
+        "log_prob_change_max_abs_diff": max(change_deltas) if change_deltas else None,
+        "per_prompt": [
+            {"reference": r, "int8": q, "agree": a} for r, q, a in zip(reference, quantized, agree)
+        ],
+    }
+
+if __name__ == "__main__":
+    tool_args, model_argv = get_tool_args()
+    prompt_set = DEFAULT_PROMPT_SET
+    if tool_args.prompt_set:
+        with open(tool_args.prompt_set) as f:
+            prompt_set = json.load(f)
+
+    reference_args = model.get_args(model_argv)
+    reference_args.int8 = False
+    reference = run_prompt_set(reference_args, prompt_set)
+
+    # score the quantized model on the same target tokens the reference used
+    for item, result in zip(prompt_set, reference):
+        item["targets"] = result["targets"]
+    quantized_args = model.get_args(model_argv)
+    quantized_args.int8 = True
+    quantized = run_prompt_set(quantized_args, prompt_set)
+
+    report = compare(reference, quantized)
+    with open(tool_args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(
+        f"argmax agreement: {report['argmax_agreement']:.3f}, "
+        f"log-prob |diff| mean {report['log_prob_mean_abs_diff']:.4f} max {report['log_prob_max_abs_diff']:.4f} "
+        f"(baseline max {report['baseline_log_prob_max_abs_diff']:.4f}), "
+        f"log-prob change |diff| mean {report['log_prob_change_mean_abs_diff']:.4f} "
+        f"max {report['log_prob_change_max_abs_diff']:.4f} over {report['prompts']} prompts"
+    )
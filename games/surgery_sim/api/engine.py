@@ -0,0 +1,209 @@
+import re
+import torch
+import torch.nn.functional as F
+
+def resolve_module(model, module_str, **kwargs):
+    """
+    Resolves a module path from module_str_dict (e.g. "model.model.layers[{layer_idx}]") against model.
+    """
+    path = module_str.format(**kwargs).split(".")
+    assert path[0] == "model", f"module path must start at the model: {module_str}"
+    module = model
+    for part in path[1:]:
+        name, indices = re.fullmatch(r"(\w+)((?:\[\d+\])*)", part).groups()
+        module = getattr(module, name)
+        for idx in re.findall(r"\[(\d+)\]", indices):
+            module = module[int(idx)]
+    return module
+
+def repeat_batch(obj, repeats, batch_size):
+    """
+    Repeats every batch-major tensor inside obj (tensors, tuples, lists, dicts) `repeats` times along dim 0.
+    Tensors whose leading dim is not the batch (broadcast masks, position ids, cache positions) are left alone.
+    """
+    if repeats == 1:
+        return obj
+    if isinstance(obj, torch.Tensor):
+        if obj.dim() >= 2 and obj.shape[0] == batch_size and batch_size > 1:
+            return obj.repeat(repeats, *([1] * (obj.dim() - 1)))
+        return obj
+    if isinstance(obj, (tuple, list)):
+        return type(obj)(repeat_batch(o, repeats, batch_size) for o in obj)
+    if isinstance(obj, dict):
+        return {k: repeat_batch(v, repeats, batch_size) for k, v in obj.items()}
+    return obj
+
+class ResidualCache:
+    """
+    Baseline residual stream at the input of every decoder layer, along with the extra arguments
+    (attention mask, position ids, rotary embeddings, ...) the model passes to its layers.
+    """
+    def __init__(self, hidden_states, layer_args, layer_kwargs, final_hidden, logits=None):
+        self.hidden_states = hidden_states
+        self.layer_args = layer_args
+        self.layer_kwargs = layer_kwargs
+        self.final_hidden = final_hidden
+        self.logits = logits
+
+    @property
+    def batch_size(self):
+        return self.hidden_states[0].shape[0]
+
+class LayerResumableEngine:
+    """
+    Runs the decoder stack of a causal LM from an arbitrary layer, on top of a cached baseline residual stream.
+
+    Layers below the lowest intervened layer always produce the baseline result, so an intervened pass
+    only needs to recompute the layers from that point on. Forward hooks on submodules of the resumed layers
+    (e.g. the down_proj interventions) fire exactly as they would in a full forward pass.
+    """
+    def __init__(self, model, module_str_dict, n_layers):
+        self.model = model
+        self.n_layers = n_layers
+        self.layers = [resolve_module(model, module_str_dict["layer"], layer_idx=i) for i in range(n_layers)]
+        self.norm = resolve_module(model, module_str_dict["norm"])
+        self.lm_head = model.get_output_embeddings()
+        self.softcap = getattr(model.config, "final_logit_softcapping", None)
+
+    @torch.no_grad()
+    def run_baseline(self, batch, full_logits=True):
+        """
+        Full forward pass without interventions that records the residual stream entering every layer
+        and the output of the final norm. With full_logits=False the LM head is skipped and cache.logits is None.
+        """
+        hidden_states = [None] * self.n_layers
+        layer_inputs = {}
+        final_hidden = {}
+
+        def norm_hook(module, inputs, output):
+            final_hidden["value"] = output
+
+        def get_pre_hook(layer_idx):
+            def pre_hook(module, args, kwargs):
+                if args:
+                    hidden_states[layer_idx], extra_args = args[0], args[1:]
+                else:
+                    hidden_states[layer_idx], extra_args = kwargs["hidden_states"], ()
+                if layer_idx == 0:
+                    layer_inputs["args"] = extra_args
+                    layer_inputs["kwargs"] = {k: v for k, v in kwargs.items() if k != "hidden_states"}
+            return pre_hook
+
+        hooks = [
+            layer.register_forward_pre_hook(get_pre_hook(i), with_kwargs=True)
+            for i, layer in enumerate(self.layers)
+        ]
+        hooks.append(self.norm.register_forward_hook(norm_hook))
+        try:
+            if full_logits:
+                logits = self.model(**batch, use_cache=False).logits
+            else:
+                self.model.base_model(**batch, use_cache=False)
+                logits = None
+        finally:
+            for handle in hooks:
+                handle.remove()
+
+        return ResidualCache(hidden_states, layer_inputs["args"], layer_inputs["kwargs"], final_hidden["value"], logits)
+
+    def _softcap(self, logits):
+        if self.softcap:
+            logits = torch.tanh(logits / self.softcap) * self.softcap
+        return logits
+
+    def unembed(self, hidden, dtype=None):
+        """Final norm and LM head on top of the last layer's output."""
+        logits = self._softcap(self.lm_head(self.norm(hidden)))
+        return logits if dtype is None else logits.to(dtype)
+
+    def _run_layers(self, cache, start_layer, repeats):
+        batch_size = cache.batch_size
+        hidden = cache.hidden_states[start_layer].repeat(repeats, 1, 1)
+        args = repeat_batch(cache.layer_args, repeats, batch_size)
+        kwargs = repeat_batch(cache.layer_kwargs, repeats, batch_size)
+        for layer in self.layers[start_layer:]:
+            output = layer(hidden, *args, **kwargs)
+            hidden = output[0] if isinstance(output, tuple) else output
+        return hidden
+
+    @torch.no_grad()
+    def resume_into_cache(self, cache, start_layer):
+        """
+        Runs layers start_layer onwards under whatever interventions are currently active and returns a
+        ResidualCache for that configuration. Layer inputs below start_layer are shared with cache, so
+        a later configuration can in turn resume from any layer of the returned cache.
+        """
+        if start_layer >= self.n_layers:
+            return cache
+        hidden_states = list(cache.hidden_states)
+        hidden = cache.hidden_states[start_layer]
+        for layer_idx in range(start_layer, self.n_layers):
+            hidden_states[layer_idx] = hidden
+            output = self.layers[layer_idx](hidden, *cache.layer_args, **cache.layer_kwargs)
+            hidden = output[0] if isinstance(output, tuple) else output
+        return ResidualCache(hidden_states, cache.layer_args, cache.layer_kwargs, self.norm(hidden))
+
+    @torch.no_grad()
+    def last_logits(self, cache, positions):
+        """Logits at one position per row from the cached final-norm hidden state, shape (batch, vocab)."""
+        hidden = cache.final_hidden
+        positions = positions.to(hidden.device)
+        rows = torch.arange(positions.shape[0], device=hidden.device)
+        return self._softcap(self.lm_head(hidden[rows, positions]))
+
+    @torch.no_grad()
+    def resume(self, cache, start_layer, repeats=1):
+        """
+        Runs layers start_layer onwards on top of the cached baseline residual and returns the logits.
+        With repeats > 1 the cached batch is tiled along dim 0, e.g. to stack several interventions in one pass.
+        """
+        if start_layer >= self.n_layers:
+            return cache.logits.repeat(repeats, 1, 1)
+        return self.unembed(self._run_layers(cache, start_layer, repeats), cache.logits.dtype)
+
+    @torch.no_grad()
+    def resume_last_hidden(self, cache, start_layer, positions, repeats=1):
+        """
+        Like resume, but returns only the final-norm hidden state at one position per row, shape (rows, hidden).
+        positions holds the position to read for each of the cache.batch_size prompts.
+        """
+        if start_layer >= self.n_layers:
+            hidden = cache.final_hidden.repeat(repeats, 1, 1)
+        else:
+            hidden = self._run_layers(cache, start_layer, repeats)
+        positions = positions.to(hidden.device).repeat(repeats)
+        rows = torch.arange(positions.shape[0], device=hidden.device)
+        if start_layer >= self.n_layers:
+            return hidden[rows, positions]
+        # the final norm is position-wise, so it can be applied after picking the positions
+        return self.norm(hidden[rows, positions])
+
+    @torch.no_grad()
+    def score(self, hidden, target_tokens, chunk_size=8192):
+        """
+        Log-probs of target_tokens and the argmax token for final hidden states of shape (rows, hidden).
+        The (rows, vocab) logits are never materialised: the normaliser is a streaming logsumexp
+        over chunks of the LM head, and the targets are read with a gather of their weight rows.
+
+        Returns (log_probs of shape (rows, len(target_tokens)), argmax token ids of shape (rows,)).
+        """
+        weight, bias = self.lm_head.weight, self.lm_head.bias
+        hidden = hidden.to(weight.device, weight.dtype)
+        rows = hidden.shape[0]
+        lse = torch.full((rows,), float("-inf"), device=weight.device)
+        best_logit = torch.full((rows,), float("-inf"), device=weight.device)
+        best_token = torch.zeros(rows, dtype=torch.long, device=weight.device)
+        for start in range(0, weight.shape[0], chunk_size):
+            stop = start + chunk_size
+            logits = F.linear(hidden, weight[start:stop], None if bias is None else bias[start:stop])
+            logits = self._softcap(logits).float()
+            lse = torch.logaddexp(lse, logits.logsumexp(dim=-1))
+            chunk_best, chunk_token = logits.max(dim=-1)
+            better = chunk_best > best_logit
+            best_logit = torch.where(better, chunk_best, best_logit)
+            best_token = torch.where(better, chunk_token + start, best_token)
+
+        targets = torch.as_tensor(target_tokens, device=weight.device)
+        target_logits = F.linear(hidden, weight[targets], None if bias is None else bias[targets])
+        target_logits = self._softcap(target_logits).float()
+        return target_logits - lse[:, None], best_token
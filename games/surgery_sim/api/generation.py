@@ -0,0 +1,138 @@
+import time
+import torch
+import model
+import steering
+
+class GenerationStats:
+    """
+    Timing of one generate_with_interventions call: time to first token and decode throughput.
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_token_time = None
+        self.end_time = None
+        self.num_tokens = 0
+
+    def token(self):
+        if self.first_token_time is None:
+            self.first_token_time = time.perf_counter()
+        self.num_tokens += 1
+
+    def finish(self):
+        self.end_time = time.perf_counter()
+
+    @property
+    def time_to_first_token(self):
+        return None if self.first_token_time is None else self.first_token_time - self.start
+
+    @property
+    def tokens_per_second(self):
+        # decode throughput, i.e. excluding the prefill that produced the first token
+        if self.end_time is None or self.num_tokens < 2:
+            return None
+        return (self.num_tokens - 1) / (self.end_time - self.first_token_time)
+
+    def report(self):
+        return {
+            "time_to_first_token": self.time_to_first_token,
+            "tokens": self.num_tokens,
+            "tokens_per_second": self.tokens_per_second,
+        }
+
+def resolve_positions(neuron_list_to_steer, prompt_len):
+    """
+    Turns negative token indices (relative to the end of the prompt) into absolute positions,
+    since during decoding the hooks only see one new position per pass.
+    """
+    return [
+        steering.Intervention(
+            n.layer, n.neuron, n.token + prompt_len if n.token < 0 else n.token,
+            getattr(n, "op", "set"), getattr(n, "value", 0.0), getattr(n, "site", steering.OUTPUT),
+        )
+        for n in neuron_list_to_steer
+    ]
+
+def get_eos_token_ids(model_a, tokenizer):
+    eos = getattr(model_a.generation_config, "eos_token_id", None)
+    if eos is None:
+        eos = tokenizer.eos_token_id
+    return set(eos) if isinstance(eos, (list, tuple)) else {eos}
+
+@torch.no_grad()
+def generate_with_interventions(model_a, tokenizer, input_strings, neuron_list_to_steer, hooks, max_new_tokens=100, temperature=0.0, prompt_cache=None, stats=None):
+    """
+    Generates from the chat-formatted input_strings with the interventions applied, yielding the next token id
+    of every prompt as a tensor of shape (batch,) as soon as it is decoded.
+
+    The prompt is prefilled in one pass with the steering hooks active, then every new token is decoded
+    incrementally on top of the KV cache. Interventions are keyed on absolute positions, so those on
+    prompt positions apply during prefill and those on later positions apply when that position is decoded.
+    Pass a GenerationStats to collect time to first token and tokens per second.
+    """
+    stats = stats if stats is not None else GenerationStats()
+    batch = model.tokenize_prompts(model_a, tokenizer, input_strings, prompt_cache)
+    if batch is None:
+        return
+    input_ids, attention_mask = batch["input_ids"], batch["attention_mask"]
+    prompt_len = input_ids.shape[1]
+    # negative tokens count back from the end of the prompt, positive ones may reach into the generated text
+    hooks.check(neuron_list_to_steer, prompt_len + max_new_tokens)
+    if any(n.token < -prompt_len for n in neuron_list_to_steer):
+        raise ValueError(f"Knob tokens must not count back past the {prompt_len} prompt positions")
+    plan = steering.SteeringPlan(resolve_positions(neuron_list_to_steer, prompt_len))
+    eos_token_ids = get_eos_token_ids(model_a, tokenizer)
+    finished = torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+
+    # left padding: positions count real tokens only, like HF generate
+    position_ids = (attention_mask.cumsum(dim=-1) - 1).clamp(min=0)
+    model_a.eval()
+    try:
+        hooks.activate(plan, position_offset=0)
+        # only the last position's logits are read, so the LM head skips the rest of the prompt
+        output = model_a(input_ids=input_ids, attention_mask=attention_mask, position_ids=position_ids, use_cache=True, logits_to_keep=1)
+        for step in range(max_new_tokens):
+            logits = output.logits[:, -1].float()
+            if temperature > 0:
+                next_tokens = torch.multinomial(torch.softmax(logits / temperature, dim=-1), num_samples=1)[:, 0]
+            else:
+                next_tokens = torch.argmax(logits, dim=-1)
+            next_tokens = torch.where(finished, tokenizer.pad_token_id, next_tokens)
+            stats.token()
+            yield next_tokens
+
+            finished |= torch.isin(next_tokens, torch.tensor(list(eos_token_ids), device=next_tokens.device))
+            if finished.all() or step == max_new_tokens - 1:
+                break
+            attention_mask = torch.cat([attention_mask, attention_mask.new_ones(attention_mask.shape[0], 1)], dim=-1)
+            position_ids = position_ids[:, -1:] + 1
+            hooks.activate(plan, position_offset=prompt_len + step)
+            output = model_a(
+                input_ids=next_tokens[:, None],
+                attention_mask=attention_mask,
+                position_ids=position_ids,
+                past_key_values=output.past_key_values,
+                use_cache=True,
+            )
+    finally:
+        hooks.deactivate()
+        stats.finish()
+
+def stream_text(model_a, tokenizer, input_string, neuron_list_to_steer, hooks, max_new_tokens=100, temperature=0.0, prompt_cache=None, stats=None):
+    """
+    Text version of generate_with_interventions for a single prompt: yields decoded text as it is generated.
+    Decoding the whole answer each step and yielding the new suffix keeps multi-byte characters intact.
+    """
+    token_ids = []
+    text = ""
+    eos_token_ids = get_eos_token_ids(model_a, tokenizer)
+    for next_tokens in generate_with_interventions(
+        model_a, tokenizer, [input_string], neuron_list_to_steer, hooks, max_new_tokens, temperature, prompt_cache, stats
+    ):
+        token_id = next_tokens[0].item()
+        if token_id in eos_token_ids:
+            break
+        token_ids.append(token_id)
+        new_text = tokenizer.decode(token_ids, skip_special_tokens=True)
+        if len(new_text) > len(text) and not new_text.endswith("�"):
+            yield new_text[len(text):]
+            text = new_text
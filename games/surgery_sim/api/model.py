@@ -3,28 +3,81 @@ import json
 import argparse
 import torch
 import torch.nn.functional as F
-import matplotlib.pyplot as plt
 import datetime
+import hashlib
+import time
+from contextlib import contextmanager
+from collections import OrderedDict
 from transformers import AutoModelForCausalLM, AutoTokenizer
+import instrumentation
+import steering
 
 timestamp = datetime.datetime.now().strftime("%d%H%M")
 
+# Module layout shared by llama-style models, and the default when no module_str_dict is given
+LLAMA_MODULE_STR_DICT = {
+    "layer": "model.model.layers[{layer_idx}]",
+    "attn": "model.model.layers[{layer_idx}].self_attn.o_proj",
+    "down_proj": "model.model.layers[{layer_idx}].mlp.down_proj",
+    "norm": "model.model.norm",
+}
+DEFAULT_MODULE_STR_DICT = LLAMA_MODULE_STR_DICT
+
 def get_device():
     device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
     return device
 
-def load_model(args):
+class StartupTimer:
+    """
+    Records the wall time of each named startup phase and writes them out as a JSON report.
+    """
+    def __init__(self):
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def report(self):
+        return {"phases": self.phases, "total": sum(self.phases.values())}
+
+    def write(self, path):
+        report = self.report()
+        print("Startup timing: " + ", ".join(f"{k}={v:.2f}s" for k, v in self.phases.items()) + f", total={report['total']:.2f}s")
+        if path:
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+
+def load_model(args, timer=None):
+    timer = timer or StartupTimer()
     model_name_or_path = args.model
-    model = AutoModelForCausalLM.from_pretrained(
-        model_name_or_path,
-        torch_dtype=torch.bfloat16,
-        trust_remote_code=True,
-        device_map="auto",
-        temperature=0
-    )
-    tokenizer = AutoTokenizer.from_pretrained(
-        model_name_or_path, trust_remote_code=True, use_fast=False
-    )
+    int8 = getattr(args, "int8", False)
+    with timer.phase("load_weights"):
+        # safetensors checkpoints are memory-mapped and copied straight to their target device
+        model = AutoModelForCausalLM.from_pretrained(
+            model_name_or_path,
+            # dynamic quantization starts from fp32 weights on the CPU
+            torch_dtype=torch.float32 if int8 else torch.bfloat16,
+            trust_remote_code=True,
+            device_map="cpu" if int8 else "auto",
+            low_cpu_mem_usage=True,
+            use_safetensors=None if getattr(args, "allow_pickle_weights", False) else True,
+            temperature=0
+        )
+    if int8:
+        with timer.phase("quantize"):
+            quantize_int8(model)
+    with timer.phase("load_tokenizer"):
+        tokenizer = AutoTokenizer.from_pretrained(
+            model_name_or_path, trust_remote_code=True, use_fast=not getattr(args, "slow_tokenizer", False)
+        )
     tokenizer.pad_token_id = tokenizer.eos_token_id
     tokenizer.padding_side = "left"
     tokenizer.mask_token_id = tokenizer.eos_token_id
@@ -32,36 +85,60 @@ def load_model(args):
     tokenizer.cls_token_id = tokenizer.eos_token_id
 
     if any([n in model_name_or_path for n in ["llama", "zephyr", "gemma", "mistral", "Qwen", "llava"]]):
-        module_str_dict = {
-            "layer": "model.model.layers[{layer_idx}]",
-            "attn": "model.model.layers[{layer_idx}].self_attn.o_proj",
-        }
+        module_str_dict = dict(LLAMA_MODULE_STR_DICT)
         n_layers = len(model.model.layers)
     elif "gpt-j" in model_name_or_path:
         module_str_dict = {
             "layer": "model.transformer.h[{layer_idx}]",
             "attn": "model.transformer.h[{layer_idx}].attn.o_proj",
+            "down_proj": "model.transformer.h[{layer_idx}].mlp.fc_out",
+            "norm": "model.transformer.ln_f",
         }
         n_layers = len(model.transformer.h)
     elif "opt" in model_name_or_path:
         module_str_dict = {
             "layer": "model.model.decoder.layers[{layer_idx}]",
             "attn": "model.model.decoder.layers[{layer_idx}].self_attn.o_proj",
+            "down_proj": "model.model.decoder.layers[{layer_idx}].fc2",
+            "norm": "model.model.decoder.final_layer_norm",
         }
         n_layers = len(model.model.decoder.layers)
     args.module_str_dict = module_str_dict
     args.n_layers = n_layers
     return model, tokenizer
 
-def steer_token_activations_logits(model_a, tokenizer, input_strings, neuron_list_to_steer, token_a, device):
+def quantize_int8(model_a):
     """
-    Given a list of neurons (with attributes layer, neuron, token) to steer,
-    progressively applies interventions on the activations and returns the changes in 
-    log probabilities for token_a and token_b.
-    
-    for now, the intervention here is done by zeroing out the activation of the specified neuron at the specified token position.
+    Dynamically quantizes every Linear of the decoder stack to int8 for CPU inference, in place.
+
+    The quantized Linears are still modules returning float tensors, so the down_proj steering hooks
+    keep working unchanged. The LM head is left in fp32: it is a single matmul per scored position,
+    and LayerResumableEngine.score reads its weight directly.
+    """
+    torch.ao.quantization.quantize_dynamic(model_a.base_model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    return model_a
+
+def warm_up(model_a, tokenizer):
+    """
+    Runs one short forward pass so CUDA context setup, kernel selection and allocator growth
+    happen at startup rather than on the first player's request.
+    """
+    batch = tokenizer(["Warm up"], return_tensors="pt")
+    device = next(model_a.parameters()).device
+    batch = {k: v.to(device) for k, v in batch.items()}
+    model_a.eval()
+    with torch.no_grad():
+        model_a(**batch)
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+
+# Bump whenever format_prompts changes, so cached tokenizations of the old prompt format are not reused
+PROMPT_FORMAT_VERSION = 1
+
+def format_prompts(tokenizer, input_strings):
+    """
+    Formats each input string into the chat-style prompt used by the game.
     """
-    # Format each input string into a chat-style prompt
     input_formatted_list = []
     for input_string in input_strings:
         input_formatted = [
@@ -73,23 +150,283 @@ def steer_token_activations_logits(model_a, tokenizer, input_strings, neuron_lis
             input_formatted, tokenize=False, continue_final_message=True
         )
         input_formatted_list.append(formatted_input)
-    
-    final_list = input_formatted_list
+    return input_formatted_list
+
+def tokenize_prompts(model_a, tokenizer, input_strings, prompt_cache=None):
+    """
+    Formats and tokenizes input_strings into a padded batch on the model's device, or None if there are no inputs.
+    If a PromptCache is given, the batch is looked up there first.
+    """
+    if prompt_cache is not None:
+        return prompt_cache.get(input_strings)
+
+    with instrumentation.stage("chat_template"):
+        final_list = format_prompts(tokenizer, input_strings)
     if not final_list:
         print("No valid inputs to process.")
-        return None, None
+        return None
     print(f"Length of final_list: {len(final_list)}")
     
     # Tokenize the batch (assumes tokenizer returns a dict with 'input_ids', etc.)
-    batch = tokenizer(final_list, return_tensors="pt", padding=True)
+    with instrumentation.stage("tokenize"):
+        batch = tokenizer(final_list, return_tensors="pt", padding=True)
     # Ensure inputs are on the same device as the model
     device = next(model_a.parameters()).device
-    batch = {k: v.to(device) for k, v in batch.items()}
+    with instrumentation.stage("to_device"):
+        return {k: v.to(device) for k, v in batch.items()}
+
+class PromptCache:
+    """
+    LRU cache of formatted, tokenized and padded prompt batches, already on the model device.
+
+    Entries are keyed on the prompt texts and a template version that covers both the tokenizer's
+    chat template and PROMPT_FORMAT_VERSION, so a template change never serves a stale tokenization.
+    """
+    def __init__(self, model_a, tokenizer, max_entries=256):
+        self.model_a = model_a
+        self.tokenizer = tokenizer
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        template = f"{PROMPT_FORMAT_VERSION}|{tokenizer.padding_side}|{getattr(tokenizer, 'chat_template', None)}"
+        self.template_version = hashlib.sha1(template.encode()).hexdigest()
+
+    def get(self, input_strings):
+        # only the lookup is timed here; a miss records its own chat_template, tokenize and to_device stages
+        with instrumentation.stage("prompt_cache"):
+            key = (self.template_version, tuple(input_strings))
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                self.entries.move_to_end(key)
+        if entry is not None:
+            return dict(entry)
+
+        self.misses += 1
+        batch = tokenize_prompts(self.model_a, self.tokenizer, input_strings)
+        if batch is not None:
+            self.entries[key] = batch
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            batch = dict(batch)
+        return batch
+
+    def warm(self, manifest_path):
+        """
+        Precomputes the cache from a JSON manifest: a list whose entries are either a prompt string
+        or a list of prompt strings that are sent together as one batch.
+        """
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        for entry in manifest:
+            self.get([entry] if isinstance(entry, str) else entry)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self.entries),
+        }
+
+def get_last_positions(attention_mask):
+    """
+    Index of the final non-pad token of every row, for either padding side.
+    """
+    return attention_mask.shape[1] - 1 - attention_mask.flip(-1).argmax(dim=-1)
+
+def get_chunk_steps(model_a, batch, num_steps, memory_budget_mb=None, full_logits=True):
+    """
+    Returns how many progressive steps can be stacked along the batch dimension of a single
+    forward pass without going over memory_budget_mb. With no budget every step goes in one pass.
+    full_logits=False leaves out the (seq_len, vocab) logits, for passes that skip the LM head.
+    """
+    if memory_budget_mb is None:
+        return num_steps
+    config = model_a.config
+    batch_size, seq_len = batch["input_ids"].shape
+    elem_size = next(model_a.parameters()).element_size()
+    hidden_size = config.hidden_size
+    intermediate_size = getattr(config, "intermediate_size", None) or 4 * hidden_size
+    # rough per-row activation footprint: fp32 logits plus the widest MLP and residual tensors
+    logits_size = config.vocab_size * 4 if full_logits else 0
+    bytes_per_row = seq_len * (logits_size + (2 * intermediate_size + 4 * hidden_size) * elem_size)
+    rows = int(memory_budget_mb * 2**20 // bytes_per_row)
+    return max(1, min(num_steps, rows // batch_size))
+
+def batched_progressive_logits(model_a, batch, plan, hooks, memory_budget_mb=None, engine=None):
+    """
+    Runs the baseline and every progressive intervention prefix of plan in as few forward passes
+    as memory_budget_mb allows, stacking the prefixes along the batch dimension.
+    Each row carries its step index and the down_proj hooks only apply the interventions that belong
+    to that row's prefix, so every row sees exactly what the sequential pass for its step sees.
+
+    If a LayerResumableEngine is given, the baseline residual stream is cached once and the intervened
+    steps are resumed from the lowest intervened layer instead of recomputing the whole stack.
+
+    Returns the last-position logits with shape (num_steps, batch, vocab), where step 0 is the baseline.
+    """
+    num_steps = plan.num_interventions + 1
+    batch_size = batch["input_ids"].shape[0]
+
+    first_step = 0
+    step_logits = []
+    if engine is not None:
+        cache = engine.run_baseline(batch)
+        step_logits.append(cache.logits[:, -1].unsqueeze(0))
+        first_step = 1
+        # every intervened step touches the plan's lowest layer, so they all resume from there
+        start_layer = plan.min_layer if plan.min_layer is not None else engine.n_layers
+
+    chunk_steps = get_chunk_steps(model_a, batch, num_steps, memory_budget_mb)
+    model_a.eval()
+    try:
+        for start in range(first_step, num_steps, chunk_steps):
+            stop = min(start + chunk_steps, num_steps)
+            hooks.activate(plan, torch.arange(start, stop).repeat_interleave(batch_size))
+            if engine is not None:
+                logits = engine.resume(cache, start_layer, repeats=stop - start)
+            else:
+                chunk = {k: v.repeat(stop - start, 1) for k, v in batch.items()}
+                with torch.no_grad():
+                    logits = model_a(**chunk).logits
+            step_logits.append(logits[:, -1].reshape(stop - start, batch_size, -1))
+    finally:
+        hooks.deactivate()
+
+    return torch.cat(step_logits, dim=0)
+
+def steer_token_activations_logits(model_a, tokenizer, input_strings, neuron_list_to_steer, token_a, device, batched=False, memory_budget_mb=None, engine=None, hooks=None, prompt_cache=None):
+    """
+    Given a list of neurons (with attributes layer, neuron, token) to steer,
+    progressively applies interventions on the activations and returns the changes in 
+    log probabilities for token_a and token_b.
+    
+    By default the intervention zeroes out the activation of the specified neuron at the specified token position.
+    Neurons that also carry op ("set", "scale" or "add") and value attributes, such as steering.Intervention,
+    are applied with that operation instead.
+
+    The neuron list is compiled once into a steering.SteeringPlan and applied through hooks, the persistent
+    steering.SteeringHooks of the caller if given, otherwise temporary ones registered for this call.
+
+    With batched=True all progressive steps (and the baseline) are stacked along the batch dimension
+    and run in one forward pass, or in chunks that fit memory_budget_mb (in MiB) if given.
+
+    With a LayerResumableEngine, intervened passes start from the cached baseline residual at the
+    lowest intervened layer instead of the embeddings.
+    """
+    batch = tokenize_prompts(model_a, tokenizer, input_strings, prompt_cache)
+    if batch is None:
+        return None, None
+    
+    owns_hooks = hooks is None
+    if owns_hooks:
+        hooks = steering.SteeringHooks(model_a, DEFAULT_MODULE_STR_DICT, len(model_a.model.layers))
+    try:
+        # Sort the list of neurons for consistency (each neuron should have attributes: layer, neuron, token)
+        with instrumentation.stage("plan"):
+            hooks.check(neuron_list_to_steer, batch["input_ids"].shape[1])
+            neuron_list_to_steer = sorted(neuron_list_to_steer, key=lambda x: (x.layer, x.token, x.neuron))
+            plan = steering.SteeringPlan(neuron_list_to_steer)
+
+        if batched:
+            with instrumentation.stage("forward"):
+                step_logits = batched_progressive_logits(model_a, batch, plan, hooks, memory_budget_mb, engine)
+                # log_softmax is row-wise, so scoring only the last position matches the sequential path
+                step_log_probs = F.log_softmax(step_logits[:, 0], dim=-1)
+                log_prob_a_changes = list(step_log_probs[:, token_a] - step_log_probs[0, token_a])
+
+            with instrumentation.stage("readback"):
+                next_token_id = torch.argmax(step_logits[-1, 0]).item()
+                next_token = tokenizer.decode([next_token_id])
+            return next_token
+
+        with instrumentation.stage("forward"):
+            log_prob_a_changes, intervened_logits = sequential_progressive_log_probs(model_a, batch, plan, hooks, token_a, engine)
+    finally:
+        if owns_hooks:
+            hooks.remove()
     
+    with instrumentation.stage("readback"):
+        next_token_id = torch.argmax(intervened_logits[-1]).item()
+        next_token = tokenizer.decode([next_token_id])
+
+    return next_token
+
+def batched_progressive_last_hidden(model_a, batch, plan, hooks, engine, memory_budget_mb=None):
+    """
+    Like batched_progressive_logits, but skips the LM head entirely and returns only the final-norm
+    hidden state at the last non-pad position of every prompt, with shape (num_steps, batch, hidden).
+    """
+    num_steps = plan.num_interventions + 1
+    batch_size = batch["input_ids"].shape[0]
+    positions = get_last_positions(batch["attention_mask"])
+
+    cache = engine.run_baseline(batch, full_logits=False)
+    step_hidden = [engine.resume_last_hidden(cache, engine.n_layers, positions).unsqueeze(0)]
+    start_layer = plan.min_layer if plan.min_layer is not None else engine.n_layers
+
+    chunk_steps = get_chunk_steps(model_a, batch, num_steps, memory_budget_mb, full_logits=False)
+    model_a.eval()
+    try:
+        for start in range(1, num_steps, chunk_steps):
+            stop = min(start + chunk_steps, num_steps)
+            hooks.activate(plan, torch.arange(start, stop).repeat_interleave(batch_size))
+            hidden = engine.resume_last_hidden(cache, start_layer, positions, repeats=stop - start)
+            step_hidden.append(hidden.reshape(stop - start, batch_size, -1))
+    finally:
+        hooks.deactivate()
+
+    return torch.cat(step_hidden, dim=0)
+
+def steer_token_activations_scores(model_a, tokenizer, input_strings, neuron_list_to_steer, target_tokens, engine, hooks, memory_budget_mb=None, chunk_size=8192, prompt_cache=None):
+    """
+    Scoring mode of steer_token_activations_logits. Progressively applies the interventions like the batched
+    mode, but runs the LM head only at the final non-pad position of every prompt and scores only target_tokens,
+    using a streaming logsumexp over the vocabulary instead of a full log_softmax.
+
+    Returns a dict with
+        "log_probs": tensor of shape (num_steps, num_prompts, num_targets), the log probability of every target
+            token for every prompt at every step, step 0 being the baseline without interventions,
+        "log_prob_changes": tensor of shape (num_steps, num_prompts, num_targets), the change in log probability
+            of every target token for every prompt at every step, relative to the baseline (step 0),
+        "next_tokens": the argmax next token of every prompt with all interventions applied.
+    """
+    batch = tokenize_prompts(model_a, tokenizer, input_strings, prompt_cache)
+    if batch is None:
+        return None
+
+    hooks.check(neuron_list_to_steer, batch["input_ids"].shape[1])
+    neuron_list_to_steer = sorted(neuron_list_to_steer, key=lambda x: (x.layer, x.token, x.neuron))
+    plan = steering.SteeringPlan(neuron_list_to_steer)
+
+    step_hidden = batched_progressive_last_hidden(model_a, batch, plan, hooks, engine, memory_budget_mb)
+    num_steps, batch_size, hidden_size = step_hidden.shape
+    log_probs, next_token_ids = engine.score(step_hidden.reshape(-1, hidden_size), target_tokens, chunk_size)
+    log_probs = log_probs.reshape(num_steps, batch_size, -1)
+    next_token_ids = next_token_ids.reshape(num_steps, batch_size)[-1]
+
+    return {
+        "log_probs": log_probs,
+        "log_prob_changes": log_probs - log_probs[0],
+        "next_tokens": [tokenizer.decode([token_id]) for token_id in next_token_ids.tolist()],
+    }
+
+def sequential_progressive_log_probs(model_a, batch, plan, hooks, token_a, engine=None):
+    """
+    Runs one forward pass per progressive step of plan and returns the changes in log probability
+    of token_a for the first prompt, along with the logits of the final (fully intervened) step.
+    """
     # Baseline forward pass without interventions
     model_a.eval()
     with torch.no_grad():
-        baseline_output = model_a(**batch)
+        if engine is not None:
+            cache = engine.run_baseline(batch)
+            baseline_output = cache
+        else:
+            baseline_output = model_a(**batch)
         # Assume output is a ModelOutput with logits of shape (batch, seq_len, vocab_size)
         baseline_logits = baseline_output.logits[0]  # take first element (shape: [seq_len, vocab_size])
         baseline_log_probs = F.log_softmax(baseline_logits, dim=-1)
@@ -99,74 +436,54 @@ def steer_token_activations_logits(model_a, tokenizer, input_strings, neuron_lis
     # Prepare lists to store the changes in log probability for each intervention step
     log_prob_a_changes = []
     
-    # Sort the list of neurons for consistency (each neuron should have attributes: layer, neuron, token)
-    neuron_list_to_steer = sorted(neuron_list_to_steer, key=lambda x: (x.layer, x.token, x.neuron))
-    
     # For a progressive intervention, we gradually add one more neuron each step.
-    num_interventions = len(neuron_list_to_steer)
-    for k in range(num_interventions + 1):
-        # Intervene on the first k neurons in the sorted list.
-        current_interventions = neuron_list_to_steer[:k]
-        
-        # Group interventions by layer; each entry is a list of (neuron_index, token_index)
-        interventions_by_layer = {}
-        for neuron in current_interventions:
-            interventions_by_layer.setdefault(neuron.layer, []).append((neuron.neuron, neuron.token))
-        
-        # Prepare a list to hold hook handles so we can remove them after the forward pass.
-        hooks = []
-        
-        # Define a factory that creates a hook for a given layer index.
-        def get_hook(layer_idx):
-            def hook(module, inputs, output):
-                # output: tensor of shape (batch, seq_len, hidden_dim)
-                if layer_idx in interventions_by_layer:
-                    for (n_idx, t_idx) in interventions_by_layer[layer_idx]:
-                        # Zero out the activation at the specified token (t_idx) and neuron index (n_idx)
-                        # (Assuming t_idx is a valid index in the sequence length)
-                        output[:, t_idx, n_idx] = 0.0
-                return output
-            return hook
-        
-        # Register hooks for each layer that requires intervention.
-        for layer_idx in interventions_by_layer.keys():
-            # Retrieve the module where interventions should be applied.
-            # (This assumes that your model has an attribute model.layers and each layer has an mlp.down_proj module.)
-            module = model_a.model.layers[layer_idx].mlp.down_proj
-            handle = module.register_forward_hook(get_hook(layer_idx))
-            hooks.append(handle)
-        
-        # Forward pass with the current interventions in place
-        with torch.no_grad():
-            intervened_output = model_a(**batch)
-            intervened_logits = intervened_output.logits[0]
-            intervened_log_probs = F.log_softmax(intervened_logits, dim=-1)
-            # Again, assume we are interested in the log probs at the final token position.
-            intervened_log_prob_a = intervened_log_probs[-1, token_a]
-        
-        # Remove the hooks to restore original behavior
-        for handle in hooks:
-            handle.remove()
-        
-        # Compute the change in log probability relative to baseline
-        delta_a = intervened_log_prob_a - baseline_log_prob_a
-        
-        log_prob_a_changes.append(delta_a)
-    
-    next_token_id = torch.argmax(intervened_logits[-1]).item()
-    next_token = tokenizer.decode([next_token_id])
+    try:
+        for k in range(plan.num_interventions + 1):
+            # Intervene on the first k neurons in the sorted list.
+            hooks.activate(plan, torch.tensor([k]))
+            
+            # Forward pass with the current interventions in place
+            with torch.no_grad():
+                if engine is not None:
+                    # layers below the first intervened layer match the baseline, so resume from there
+                    start_layer = plan.min_layer if k > 0 else engine.n_layers
+                    intervened_logits = engine.resume(cache, start_layer)[0]
+                else:
+                    intervened_output = model_a(**batch)
+                    intervened_logits = intervened_output.logits[0]
+                intervened_log_probs = F.log_softmax(intervened_logits, dim=-1)
+                # Again, assume we are interested in the log probs at the final token position.
+                intervened_log_prob_a = intervened_log_probs[-1, token_a]
+            
+            # Compute the change in log probability relative to baseline
+            delta_a = intervened_log_prob_a - baseline_log_prob_a
+            
+            log_prob_a_changes.append(delta_a)
+    finally:
+        hooks.deactivate()
 
-    return next_token
+    return log_prob_a_changes, intervened_logits
 
 
-def get_args():
+def get_args(argv=None):
     parser = argparse.ArgumentParser()
     parser.add_argument("--model", type=str, default="/data/huggingface/models--meta-llama--Meta-Llama-3.1-8B-Instruct/snapshots/5206a32e0bd3067aef1ce90f5528ade7d866253f")
     parser.add_argument("--layer-skip", type=int, default=3)
     parser.add_argument("--batch-size", "-bs", type=int, default=10)
-    return parser.parse_args()
+    parser.add_argument("--prompt-manifest", type=str, default=None, help="JSON list of game prompts to pre-tokenize at startup")
+    parser.add_argument("--prompt-cache-size", type=int, default=256)
+    parser.add_argument("--session-memory-mb", type=int, default=4096, help="Cap on residual streams kept for incremental per-session recompute")
+    parser.add_argument("--int8", action="store_true", help="Load an int8 dynamically quantized model for CPU-only nodes")
+    parser.add_argument("--slow-tokenizer", action="store_true", help="Use the slow (SentencePiece) tokenizer")
+    parser.add_argument("--allow-pickle-weights", action="store_true", help="Fall back to .bin checkpoints when no safetensors are available")
+    parser.add_argument("--no-warmup", action="store_true")
+    parser.add_argument("--startup-report", type=str, default="startup_timing.json")
+    return parser.parse_args(argv)
 
 def plot_results(log_prob_a_changes, log_prob_b_changes, token_a):
+    # plotting is only used offline, so keep matplotlib out of the server's import path
+    import matplotlib.pyplot as plt
+
     x_labels = [str(i) for i in range(len(log_prob_a_changes))]
     plt.figure(figsize=(12, 8))
     
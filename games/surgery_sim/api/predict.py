@@ -1,27 +1,128 @@
 # Prediction interface for Cog ⚙️
 # https://cog.run/python
 
-from cog import BasePredictor, Input, Path
+import time
+_import_start = time.perf_counter()
+
+from cog import BasePredictor, ConcatenateIterator, Input, Path
+import torch
+import os
 import model
+import instrumentation
+import engine
+import steering
+import sessions
+import generation
+
+_import_seconds = time.perf_counter() - _import_start
+
+# Deployment settings, read from the environment since Cog's own command line is not meant for us:
+# SURGERY_PROMPT_MANIFEST, SURGERY_SESSION_MEMORY_MB, SURGERY_STARTUP_REPORT, SURGERY_INT8=1, SURGERY_NO_WARMUP=1
+ENV_OPTIONS = {
+    "SURGERY_PROMPT_MANIFEST": "--prompt-manifest",
+    "SURGERY_SESSION_MEMORY_MB": "--session-memory-mb",
+    "SURGERY_STARTUP_REPORT": "--startup-report",
+}
+ENV_FLAGS = {
+    "SURGERY_INT8": "--int8",
+    "SURGERY_NO_WARMUP": "--no-warmup",
+}
+
+def env_argv(environ=os.environ):
+    """model.get_args arguments for the settings present in environ."""
+    argv = []
+    for name, option in ENV_OPTIONS.items():
+        if environ.get(name):
+            argv += [option, environ[name]]
+    for name, flag in ENV_FLAGS.items():
+        if environ.get(name, "").lower() in ("1", "true", "yes"):
+            argv.append(flag)
+    return argv
 
 class Predictor(BasePredictor):
     def setup(self) -> None:
         """Load the model into memory to make running multiple predictions efficient"""
         # self.model = torch.load("./weights.pth")
+        timer = model.StartupTimer()
+        timer.add("imports", _import_seconds)
         self.device = model.get_device()
-        args = model.get_args()
-        self.model, self.tokenizer = model.load_model(args)
+        args = model.get_args(env_argv())
+        model_a, tokenizer = model.load_model(args, timer)
+        self.prepare(model_a, tokenizer, args, timer)
+
+    def prepare(self, model_a, tokenizer, args, timer):
+        """
+        Everything setup builds around the loaded model. benchmarks/standins.py calls it with a tiny random Llama,
+        so run_benchmarks and check_steering exercise the same engine, hooks and caches as a deployment
+        """
+        self.model, self.tokenizer = model_a, tokenizer
+        with timer.phase("hooks"):
+            self.engine = engine.LayerResumableEngine(self.model, args.module_str_dict, args.n_layers)
+            # Steering hooks stay registered for the Predictor's lifetime; each request only swaps the active plan
+            self.hooks = steering.SteeringHooks(self.model, args.module_str_dict, args.n_layers)
+            self.sessions = sessions.SessionCache(self.engine, args.session_memory_mb)
+        with timer.phase("prompt_cache"):
+            self.prompt_cache = model.PromptCache(self.model, self.tokenizer, args.prompt_cache_size)
+            if args.prompt_manifest:
+                self.prompt_cache.warm(args.prompt_manifest)
+        if not args.no_warmup:
+            with timer.phase("warmup"):
+                model.warm_up(self.model, self.tokenizer)
+        timer.write(args.startup_report)
+        instrumentation.serve_metrics(int(os.environ.get("METRICS_PORT", 0)))
 
     def predict(
         self,
-        knob_turns: str = Input(description="How much each neuron's knob was turned"), # CHANGE INTPUT AND OUTPUT TYPE
+        knob_turns: str = Input(description="How much each neuron's knob was turned, as a JSON list of {layer, neuron, token, amount[, op, site]}"), # CHANGE INTPUT AND OUTPUT TYPE
+        session_id: str = Input(description="Player session; consecutive knob turns in a session reuse the previous residual stream", default=""),
     ) -> dict:
         """Run a single prediction on the model"""
         # Run inference with the given neurons tweaked by the knob amount
         input_strings = []
-        neuron_list_to_steer = []
+        with instrumentation.request("surgery_sim", batch_size=len(input_strings)):
+            with instrumentation.stage("parse"):
+                neuron_list_to_steer = steering.parse_knob_turns(knob_turns)
+
+            if session_id:
+                batch = model.tokenize_prompts(self.model, self.tokenizer, input_strings, self.prompt_cache)
+                if batch is None:
+                    return {"prediction": None}
+                with instrumentation.stage("forward"):
+                    logits = self.sessions.last_logits(session_id, tuple(input_strings), batch, neuron_list_to_steer, self.hooks)
+                with instrumentation.stage("readback"):
+                    prediction = self.tokenizer.decode([torch.argmax(logits[0]).item()])
+                return {"prediction": prediction}
 
-        token_id = 3
-        prediction = model.steer_token_activations_logits(self.model, self.tokenizer, input_strings, neuron_list_to_steer, token_id, self.device)
+            token_id = 3
+            prediction = model.steer_token_activations_logits(self.model, self.tokenizer, input_strings, neuron_list_to_steer, token_id, self.device, engine=self.engine, hooks=self.hooks, prompt_cache=self.prompt_cache)
     
         return {"prediction": prediction}
+
+    def cache_stats(self):
+        """Hit rates and sizes of the prompt and session caches, for the gateway's /stats."""
+        return {"prompt_cache": self.prompt_cache.stats(), "sessions": self.sessions.stats()}
+
+    def stream(self, prompt, knob_turns="", max_new_tokens=100, temperature=0.0):
+        """
+        Generates an answer to prompt token by token with the knobs applied, reusing the KV cache between
+        steps. Served by StreamingPredictor under Cog and by the gateway's POST /api/generate.
+        """
+        neuron_list_to_steer = steering.parse_knob_turns(knob_turns)
+        stats = generation.GenerationStats()
+        yield from generation.stream_text(
+            self.model, self.tokenizer, prompt, neuron_list_to_steer, self.hooks,
+            max_new_tokens, temperature, self.prompt_cache, stats,
+        )
+        print(f"Generation stats: {stats.report()}")
+
+class StreamingPredictor(Predictor):
+    """Streams a long answer with the knob interventions applied; cog-streaming.yaml points Cog at this class."""
+    def predict(
+        self,
+        prompt: str = Input(description="The message to answer"),
+        knob_turns: str = Input(description="How much each neuron's knob was turned, as a JSON list of {layer, neuron, token, amount[, op, site]}", default=""),
+        max_new_tokens: int = Input(description="Maximum number of tokens to generate", default=100),
+        temperature: float = Input(description="Sampling temperature, 0 for greedy decoding", default=0.0),
+    ) -> ConcatenateIterator[str]:
+        """Generate an answer token by token, reusing the KV cache between steps"""
+        yield from self.stream(prompt, knob_turns, max_new_tokens, temperature)
@@ -0,0 +1,109 @@
+from collections import OrderedDict
+import torch
+import model
+import steering
+
+class SessionState:
+    """
+    A player's last knob configuration on a given prompt batch, with the residual stream it produced.
+    """
+    def __init__(self, prompt_key, plan, cache, positions):
+        self.prompt_key = prompt_key
+        self.plan = plan
+        self.cache = cache
+        self.positions = positions
+        self.nbytes = cache_nbytes(cache)
+
+def cache_nbytes(cache):
+    """Bytes held by the hidden states of a ResidualCache, counting tensors shared between layers once."""
+    tensors = {t.data_ptr(): t for t in cache.hidden_states + [cache.final_hidden] if t is not None}
+    return sum(t.numel() * t.element_size() for t in tensors.values())
+
+class SessionCache:
+    """
+    Session-scoped residual streams for incremental recompute.
+
+    A player usually turns one knob at a time, so between two requests of the same session only a
+    few layers' interventions change. Layers below the lowest changed layer produce exactly the
+    residual stream of the previous configuration, so each request resumes from there instead of
+    recomputing the whole stack. Sessions are evicted least-recently-used first once the cached
+    residual streams go over max_memory_mb.
+    """
+    def __init__(self, engine, max_memory_mb=4096):
+        self.engine = engine
+        self.max_bytes = max_memory_mb * 2**20
+        self.sessions = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.layers_computed = 0
+        self.layers_skipped = 0
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and len(self.sessions) > 1:
+            _, state = self.sessions.popitem(last=False)
+            self.total_bytes -= state.nbytes
+            self.evictions += 1
+
+    def _store(self, session_id, state):
+        old = self.sessions.pop(session_id, None)
+        if old is not None:
+            self.total_bytes -= old.nbytes
+        self.sessions[session_id] = state
+        self.total_bytes += state.nbytes
+        self._evict()
+
+    def drop(self, session_id):
+        state = self.sessions.pop(session_id, None)
+        if state is not None:
+            self.total_bytes -= state.nbytes
+
+    @torch.no_grad()
+    def last_logits(self, session_id, prompt_key, batch, neuron_list_to_steer, hooks):
+        """
+        Applies all of neuron_list_to_steer at once and returns the logits at the last non-pad position
+        of every prompt, shape (batch, vocab), reusing the session's previous residual stream when possible.
+        """
+        hooks.check(neuron_list_to_steer, batch["input_ids"].shape[1])
+        plan = steering.SteeringPlan(neuron_list_to_steer)
+        state = self.sessions.get(session_id)
+        n_layers = self.engine.n_layers
+
+        if state is not None and state.prompt_key == prompt_key:
+            self.hits += 1
+            self.sessions.move_to_end(session_id)
+            start_layer = plan.first_changed_layer(state.plan)
+            base_cache, positions = state.cache, state.positions
+        else:
+            self.misses += 1
+            base_cache = self.engine.run_baseline(batch, full_logits=False)
+            positions = model.get_last_positions(batch["attention_mask"])
+            start_layer = plan.min_layer
+            self.layers_computed += n_layers
+        start_layer = n_layers if start_layer is None else start_layer
+
+        hooks.activate(plan)
+        try:
+            cache = self.engine.resume_into_cache(base_cache, start_layer)
+        finally:
+            hooks.deactivate()
+        self.layers_computed += n_layers - start_layer
+        if state is not None and state.prompt_key == prompt_key:
+            self.layers_skipped += start_layer
+
+        self._store(session_id, SessionState(prompt_key, plan, cache, positions))
+        return self.engine.last_logits(cache, positions)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "sessions": len(self.sessions),
+            "memory_mb": self.total_bytes / 2**20,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "layers_computed": self.layers_computed,
+            "layers_skipped": self.layers_skipped,
+        }
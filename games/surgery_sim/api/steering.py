@@ -0,0 +1,231 @@
+import json
+import time
+from collections import namedtuple
+import torch
+import instrumentation
+from engine import resolve_module
+
+# Supported intervention operations, as stored in the compiled op tensors
+SET, SCALE, ADD = 0, 1, 2
+OPS = {"set": SET, "scale": SCALE, "add": ADD}
+
+# Where a knob acts: on down_proj's output (hidden size, the game's knobs) or on its input, the MLP
+# neurons of intermediate size that the neuron labels and attribution.py rank
+OUTPUT, INPUT = "output", "input"
+SITES = (OUTPUT, INPUT)
+
+# A single knob: op is one of OPS, value is what the activation is set to, scaled by or offset by.
+# Anything with layer, neuron and token attributes works too and defaults to ("set", 0.0, "output"),
+# i.e. zero ablation of a down_proj output neuron.
+Intervention = namedtuple("Intervention", ["layer", "neuron", "token", "op", "value", "site"], defaults=["set", 0.0, OUTPUT])
+
+def parse_knob_turns(knob_turns, default_op="scale"):
+    """
+    Parses the knob_turns JSON from Predictor.predict into Interventions. Each knob is an object with
+    layer, neuron, token and amount, plus an optional op ("set", "scale" or "add", default_op otherwise)
+    and an optional site ("output" by default, or "input" for the down_proj input neurons).
+    Indices are range-checked against the model by SteeringHooks.check once the prompt is tokenized.
+    """
+    if not knob_turns:
+        return []
+    knobs = [
+        Intervention(int(k["layer"]), int(k["neuron"]), int(k["token"]), k.get("op", default_op), float(k["amount"]), k.get("site", OUTPUT))
+        for k in json.loads(knob_turns)
+    ]
+    for knob in knobs:
+        if knob.site not in SITES:
+            raise ValueError(f"Unknown knob site {knob.site!r}, expected one of {SITES}")
+        if knob.op not in OPS:
+            raise ValueError(f"Unknown knob op {knob.op!r}, expected one of {tuple(OPS)}")
+    return knobs
+
+def apply_ops(op, value, current):
+    """Applies set/scale/add elementwise to the current activations."""
+    return torch.where(op == SET, value, torch.where(op == SCALE, current * value, current + value))
+
+class SteeringPlan:
+    """
+    A list of interventions compiled into per-layer index and value tensors.
+
+    Entry i of the list is tagged with step i + 1, so the same plan can be applied progressively:
+    a row running at step k only sees interventions 0..k-1 (see SteeringHooks.activate).
+    Interventions on the same (layer, token, neuron) are expected to be unique.
+
+    If rows is given (one batch row per intervention), each intervention only applies to its own row,
+    which lets unrelated requests with different knobs share one batch. Progressive steps are ignored then.
+
+    Output-site interventions are compiled into layers, input-site ones into input_layers; both count as
+    their layer for min_layer and first_changed_layer, since either changes that layer's output.
+    """
+    def __init__(self, interventions, rows=None):
+        self.has_rows = rows is not None
+        by_site = {OUTPUT: {}, INPUT: {}}
+        for step, iv in enumerate(interventions):
+            op = OPS[getattr(iv, "op", "set")]
+            value = float(getattr(iv, "value", 0.0))
+            row = rows[step] if self.has_rows else 0
+            by_site[getattr(iv, "site", OUTPUT)].setdefault(iv.layer, []).append((iv.token, iv.neuron, op, value, step + 1, row))
+
+        self.num_interventions = len(interventions)
+        # order-independent description of what the plan does at each layer, ignoring progressive steps
+        self.layer_signatures = {}
+        for site, by_layer in by_site.items():
+            for layer_idx, entries in by_layer.items():
+                self.layer_signatures[layer_idx] = tuple(sorted(
+                    self.layer_signatures.get(layer_idx, ()) + tuple((site,) + entry[:4] for entry in entries)
+                ))
+        self.layers = self._compile(by_site[OUTPUT])
+        self.input_layers = self._compile(by_site[INPUT])
+        self._on_device = {}
+
+    @staticmethod
+    def _compile(by_layer):
+        compiled = {}
+        for layer_idx, entries in by_layer.items():
+            token, neuron, op, value, step, row = zip(*entries)
+            compiled[layer_idx] = (
+                torch.tensor(token),
+                torch.tensor(neuron),
+                torch.tensor(op),
+                torch.tensor(value, dtype=torch.float32),
+                torch.tensor(step),
+                torch.tensor(row),
+            )
+        return compiled
+
+    @property
+    def min_layer(self):
+        return min(self.layer_signatures.keys(), default=None)
+
+    def first_changed_layer(self, other):
+        """
+        Lowest layer at which this plan and other (a SteeringPlan or None for no interventions) differ,
+        or None if they apply exactly the same interventions.
+        """
+        other_signatures = other.layer_signatures if other is not None else {}
+        changed = [
+            layer_idx for layer_idx in set(self.layer_signatures) | set(other_signatures)
+            if self.layer_signatures.get(layer_idx) != other_signatures.get(layer_idx)
+        ]
+        return min(changed, default=None)
+
+    def layer_tensors(self, layer_idx, device, site=OUTPUT):
+        """(token, neuron, op, value, step, row) tensors for layer_idx and site, moved to device once and reused."""
+        key = (layer_idx, device, site)
+        if key not in self._on_device:
+            layers = self.layers if site == OUTPUT else self.input_layers
+            self._on_device[key] = tuple(t.to(device) for t in layers[layer_idx])
+        return self._on_device[key]
+
+class SteeringHooks:
+    """
+    Forward hooks that stay registered on every down_proj for the lifetime of the model and apply
+    whichever SteeringPlan is active, as one vectorized gather/scatter per layer. Forward pre-hooks on the
+    same modules apply the plan's input-site interventions to down_proj's input. With no active plan
+    the hooks return their tensors untouched.
+    """
+    def __init__(self, model, module_str_dict, n_layers):
+        self.plan = None
+        self.row_steps = None
+        self.position_offset = None
+        self._row_steps_on_device = {}
+        self.n_layers = n_layers
+        self.handles = []
+        for i in range(n_layers):
+            down_proj = resolve_module(model, module_str_dict["down_proj"], layer_idx=i)
+            self.handles.append(down_proj.register_forward_hook(self._get_hook(i)))
+            self.handles.append(down_proj.register_forward_pre_hook(self._get_pre_hook(i)))
+        # neurons a knob can index at each site
+        self.widths = {OUTPUT: down_proj.out_features, INPUT: down_proj.in_features}
+
+    def check(self, knobs, seq_len):
+        """
+        Raises ValueError for any knob that does not fit the model and a pass over seq_len positions:
+        layer in [0, n_layers), neuron within its site's width, token in [-seq_len, seq_len) and a known op.
+        Out-of-range indices would otherwise be silently ignored (layers) or hit the vectorized scatter,
+        which on CUDA fails with a device-side assert instead of an IndexError.
+        """
+        for knob in knobs:
+            site, op = getattr(knob, "site", OUTPUT), getattr(knob, "op", "set")
+            if site not in self.widths:
+                raise ValueError(f"Unknown knob site {site!r}, expected one of {SITES}")
+            if op not in OPS:
+                raise ValueError(f"Unknown knob op {op!r}, expected one of {tuple(OPS)}")
+            if not 0 <= knob.layer < self.n_layers:
+                raise ValueError(f"Knob layer {knob.layer} is outside [0, {self.n_layers})")
+            if not 0 <= knob.neuron < self.widths[site]:
+                raise ValueError(f"Knob neuron {knob.neuron} is outside [0, {self.widths[site]}) for site {site!r}")
+            if not -seq_len <= knob.token < seq_len:
+                raise ValueError(f"Knob token {knob.token} is outside [-{seq_len}, {seq_len})")
+
+    def activate(self, plan, row_steps=None, position_offset=None):
+        """
+        Makes plan the active plan. row_steps optionally gives the progressive step of every batch row
+        (a tensor of shape (batch,) or (1,)); a row at step k applies only the first k interventions.
+
+        position_offset switches token indices from "index into this forward pass" to absolute positions:
+        the pass is taken to cover positions position_offset onwards, as in KV-cached decoding, and
+        interventions outside it are skipped. Negative token indices are not resolved in that mode.
+        """
+        self.plan = plan
+        self.row_steps = row_steps
+        self.position_offset = position_offset
+        self._row_steps_on_device = {}
+
+    def deactivate(self):
+        self.activate(None)
+
+    def remove(self):
+        for handle in self.handles:
+            handle.remove()
+        self.handles = []
+
+    def _get_row_steps(self, device):
+        if device not in self._row_steps_on_device:
+            self._row_steps_on_device[device] = self.row_steps.to(device)
+        return self._row_steps_on_device[device]
+
+    def _get_hook(self, layer_idx):
+        def hook(module, inputs, output):
+            # output: tensor of shape (batch, seq_len, hidden_dim)
+            plan = self.plan
+            if plan is None or layer_idx not in plan.layers:
+                return output
+            start = time.perf_counter()
+            output = self._steer(plan, layer_idx, output)
+            instrumentation.add("hooks", time.perf_counter() - start)
+            return output
+        return hook
+
+    def _get_pre_hook(self, layer_idx):
+        def pre_hook(module, inputs):
+            # inputs[0]: down_proj's input of shape (batch, seq_len, intermediate_size)
+            plan = self.plan
+            if plan is None or layer_idx not in plan.input_layers:
+                return None
+            start = time.perf_counter()
+            x = self._steer(plan, layer_idx, inputs[0], INPUT)
+            instrumentation.add("hooks", time.perf_counter() - start)
+            return (x,) + tuple(inputs[1:])
+        return pre_hook
+
+    def _steer(self, plan, layer_idx, output, site=OUTPUT):
+        """Applies plan's interventions for layer_idx and site to output of shape (batch, seq_len, dim) in place."""
+        t_idx, n_idx, op, value, step, row = plan.layer_tensors(layer_idx, output.device, site)
+        if self.position_offset is not None:
+            t_idx = t_idx - self.position_offset
+            keep = (t_idx >= 0) & (t_idx < output.shape[1])
+            if not keep.any():
+                return output
+            t_idx, n_idx, op, value, step, row = (t[keep] for t in (t_idx, n_idx, op, value, step, row))
+        if plan.has_rows:
+            output[row, t_idx, n_idx] = apply_ops(op, value, output[row, t_idx, n_idx]).to(output.dtype)
+            return output
+        current = output[:, t_idx, n_idx]
+        steered = apply_ops(op, value, current)
+        if self.row_steps is not None:
+            # active[r, j] is True when row r's step includes the j-th intervention of this layer
+            active = self._get_row_steps(output.device)[:, None] >= step[None, :]
+            steered = torch.where(active, steered, current)
+        output[:, t_idx, n_idx] = steered.to(output.dtype)
+        return output
@@ -0,0 +1,57 @@
+import string
+import torch
+from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+from tokenizers import Regex, Tokenizer, models, pre_tokenizers
+import model
+
+# Same message layout as the Llama 3 chat template, with plain-text role markers
+TINY_CHAT_TEMPLATE = (
+    "{% for message in messages %}"
+    "<{{ message['role'] }}>{{ message['content'] }}"
+    "{% if not loop.last %}<eot>{% endif %}"
+    "{% endfor %}"
+)
+
+def build_tiny_tokenizer():
+    """
+    Character-level tokenizer with a chat template, built in memory so it needs no download.
+    """
+    specials = ["<eos>", "<unk>", "<eot>", "<user>", "<assistant>", "<system>"]
+    vocab = {token: i for i, token in enumerate(specials + list(string.printable))}
+    tokenizer = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Split(Regex("<[a-z]+>|."), behavior="isolated")
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=tokenizer, eos_token="<eos>", unk_token="<unk>")
+    tokenizer.chat_template = TINY_CHAT_TEMPLATE
+    tokenizer.pad_token_id = tokenizer.eos_token_id
+    tokenizer.padding_side = "left"
+    return tokenizer
+
+def build_tiny_model(vocab_size, n_layers=4, hidden_size=64, intermediate_size=256, seed=0):
+    """
+    Random-weight Llama with the same module layout as Llama-3.1-8B (model.layers[i].mlp.down_proj, ...).
+    """
+    torch.manual_seed(seed)
+    config = LlamaConfig(
+        vocab_size=vocab_size,
+        hidden_size=hidden_size,
+        intermediate_size=intermediate_size,
+        num_hidden_layers=n_layers,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=2048,
+    )
+    model_a = LlamaForCausalLM(config).eval()
+    model_a.generation_config.eos_token_id = 0
+    return model_a
+
+def load_tiny(args=None, **kwargs):
+    """
+    Drop-in stand-in for model.load_model: returns a tiny random (model, tokenizer) pair and fills
+    args.module_str_dict and args.n_layers the same way.
+    """
+    tokenizer = build_tiny_tokenizer()
+    model_a = build_tiny_model(len(tokenizer), **kwargs)
+    if args is not None:
+        args.module_str_dict = dict(model.LLAMA_MODULE_STR_DICT)
+        args.n_layers = len(model_a.model.layers)
+    return model_a, tokenizer
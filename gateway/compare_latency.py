@@ -0,0 +1,85 @@
+"""
+End-to-end latency of the same requests through the Express server (Replicate path) and the local gateway.
+
+    python compare_latency.py --replicate http://localhost:4167 --gateway http://localhost:4168 [--requests 20] [--report latency.json]
+
+Requests go out one at a time, so the numbers are per-request latency rather than throughput. Leave out
+--replicate or --gateway to measure only one side.
+"""
+import argparse
+import json
+import time
+import urllib.request
+
+WORDS = ["water", "ocean", "rain", "fire", "desert", "river", "cloud", "stone"]
+# a short diagonal stroke, in the flat [x1, y1, x2, y2, ...] form the client sends
+POINTS = [v for i in range(8, 20) for v in (i, i)]
+
+# route -> body for the i-th request
+REQUESTS = {
+    "/api/predict": lambda i: {"points": POINTS[: 2 * (i % 12 + 1)]},
+    "/coordinates": lambda i: {"word": WORDS[i % len(WORDS)]},
+}
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--replicate", type=str, default=None, help="Base URL of server/index.js")
+    parser.add_argument("--gateway", type=str, default=None, help="Base URL of gateway.py")
+    parser.add_argument("--routes", nargs="+", choices=list(REQUESTS), default=list(REQUESTS))
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--report", type=str, default=None)
+    return parser.parse_args()
+
+def post(url, body):
+    request = urllib.request.Request(url, data=json.dumps(body).encode(), headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=300) as response:
+        return json.loads(response.read())
+
+def measure(base_url, route, num_requests):
+    """Latencies in milliseconds of num_requests sequential requests, and how many failed."""
+    latencies, errors = [], 0
+    for i in range(num_requests):
+        start = time.perf_counter()
+        try:
+            post(base_url + route, REQUESTS[route](i))
+        except Exception as e:
+            errors += 1
+            print(f"{base_url}{route} failed: {e}")
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies, errors
+
+def summarize(latencies, errors):
+    ordered = sorted(latencies)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))] if ordered else None
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "mean_ms": sum(ordered) / len(ordered) if ordered else None,
+        "p50_ms": pick(50),
+        "p95_ms": pick(95),
+        "max_ms": ordered[-1] if ordered else None,
+    }
+
+if __name__ == "__main__":
+    args = get_args()
+    targets = {name: url.rstrip("/") for name, url in [("replicate", args.replicate), ("gateway", args.gateway)] if url}
+    if not targets:
+        raise SystemExit("Pass --replicate and/or --gateway")
+
+    report = {}
+    for route in args.routes:
+        for name, url in targets.items():
+            # one untimed request so connection setup and cold starts do not land in the numbers
+            measure(url, route, 1)
+            report.setdefault(route, {})[name] = summarize(*measure(url, route, args.requests))
+
+    fmt = lambda v: "-" if v is None else f"{v:.1f}"
+    print(f"{'route':<14}{'path':<11}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'errors':>8}")
+    for route, by_target in report.items():
+        for name, stats in by_target.items():
+            print(f"{route:<14}{name:<11}{fmt(stats['mean_ms']):>10}{fmt(stats['p50_ms']):>10}"
+                  f"{fmt(stats['p95_ms']):>10}{fmt(stats['max_ms']):>10}{stats['errors']:>8}")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
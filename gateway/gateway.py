@@ -0,0 +1,329 @@
+"""
+Local inference gateway: serves the adversarial_ml, polysemantic and surgery_sim Predictors from one
+asyncio process, with the routes and response shapes of server/index.js, so the client can use local
+models instead of Replicate.
+
+    python gateway.py [--port 4168] [--games adversarial_ml polysemantic] [--queue-size 64]
+
+Run it with --port 4167 in place of the Express server to serve the client directly.
+
+    POST /api/predict   {"points": [...]}                         -> {"prediction": {...}}               adversarial_ml
+    POST /coordinates   {"word": "..."}                           -> {"coordinates": [x, y], "scalar": a}  polysemantic
+    POST /api/steer     {"knob_turns": [...], "session_id": "..."} -> {"prediction": "..."}               surgery_sim
+    POST /api/generate  {"prompt": "...", "knob_turns": [...]}     -> text/plain answer, streamed in chunks  surgery_sim
+    GET  /stats         queue depth, request counts, latency percentiles and cache hit rates per model
+    GET  /metrics       per-stage timings of all Predictors in the Prometheus text format
+"""
+import argparse
+import asyncio
+import importlib.util
+import inspect
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GAMES = ["adversarial_ml", "polysemantic", "surgery_sim"]
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4168)
+    parser.add_argument("--games", nargs="+", choices=GAMES, default=GAMES)
+    parser.add_argument("--queue-size", type=int, default=64, help="Requests waiting per model before new ones are rejected")
+    return parser.parse_args()
+
+def load_predictor(game):
+    """
+    Imports games/<game>/api/predict.py under a unique module name and runs setup() from the api directory,
+    which is where Cog runs it and where the Predictors look for their weights.
+    """
+    api_dir = os.path.join(REPO_ROOT, "games", game, "api")
+    # the api modules import their neighbours flatly (import model, from readout import ...)
+    sys.path.insert(0, api_dir)
+    spec = importlib.util.spec_from_file_location(f"{game}_predict", os.path.join(api_dir, "predict.py"))
+    module = importlib.util.module_from_spec(spec)
+    cwd = os.getcwd()
+    os.chdir(api_dir)
+    try:
+        spec.loader.exec_module(module)
+        predictor = module.Predictor()
+        predictor.setup()
+    finally:
+        os.chdir(cwd)
+    return predictor
+
+def call_predict(predictor, inputs, method="predict"):
+    """Calls predictor.<method> with inputs, filling every other argument with the default of its Cog Input."""
+    fn = getattr(predictor, method)
+    kwargs = {}
+    for name, param in inspect.signature(fn).parameters.items():
+        if name in inputs:
+            kwargs[name] = inputs[name]
+        elif param.default is not inspect.Parameter.empty:
+            # Input(...) returns a field object; the plain default lives on it
+            kwargs[name] = getattr(param.default, "default", param.default)
+    return fn(**kwargs)
+
+def call_stream(predictor, inputs, loop, chunks):
+    """Runs predictor.stream on the worker thread, handing every chunk to the event loop as it is generated."""
+    for chunk in call_predict(predictor, inputs, "stream"):
+        loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+class QueueFull(Exception):
+    pass
+
+class ModelWorker:
+    """
+    One Predictor behind a bounded queue. Requests run one at a time on the worker's own thread, since a
+    Predictor keeps per-request state (steering plans, hooks), while different models run in parallel.
+    """
+    def __init__(self, name, predictor, queue_size):
+        self.name = name
+        self.predictor = predictor
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self.latencies = deque(maxlen=1000)
+        self.served = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def _enqueue(self, inputs, chunks=None):
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((inputs, future, time.perf_counter(), chunks))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFull(self.name)
+        return future
+
+    async def submit(self, inputs):
+        """Result of predict(**inputs), raising QueueFull instead of waiting when the queue is full."""
+        return await self._enqueue(inputs)
+
+    def submit_stream(self, inputs):
+        """
+        Queues stream(**inputs) and returns an async iterator over its chunks, raising QueueFull right away
+        when the queue is full. Errors while generating are raised from the iterator.
+        """
+        chunks = asyncio.Queue()
+        future = self._enqueue(inputs, chunks)
+
+        async def iterate():
+            while True:
+                getter = asyncio.ensure_future(chunks.get())
+                done, _ = await asyncio.wait({getter, future}, return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    yield getter.result()
+                    continue
+                getter.cancel()
+                # every chunk was handed over before the stream finished, so the rest are already queued
+                while not chunks.empty():
+                    yield chunks.get_nowait()
+                future.result()
+                return
+        return iterate()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            inputs, future, start, chunks = await self.queue.get()
+            try:
+                if chunks is None:
+                    result = await loop.run_in_executor(self.executor, call_predict, self.predictor, inputs)
+                else:
+                    result = await loop.run_in_executor(self.executor, call_stream, self.predictor, inputs, loop, chunks)
+            except Exception as e:
+                self.failed += 1
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                self.served += 1
+                if not future.done():
+                    future.set_result(result)
+            self.latencies.append(time.perf_counter() - start)
+            self.queue.task_done()
+
+    def stats(self):
+        latencies = [latency * 1000 for latency in self.latencies]
+        stats = {"queued": self.queue.qsize(), "served": self.served, "failed": self.failed, "rejected": self.rejected}
+        for q in (50, 95, 99):
+            stats[f"p{q}_ms"] = percentile(latencies, q)
+        # counters only, so reading them while the worker thread serves a request is safe enough
+        cache_stats = getattr(self.predictor, "cache_stats", None)
+        if cache_stats is not None:
+            stats["caches"] = cache_stats()
+        return stats
+
+def steer_inputs(body):
+    knob_turns = body.get("knob_turns", [])
+    if not isinstance(knob_turns, str):
+        knob_turns = json.dumps(knob_turns)
+    return {"knob_turns": knob_turns, "session_id": body.get("session_id", "")}
+
+# path -> (game, request body to predict inputs, predict output to response body), as in server/index.js
+ROUTES = {
+    "/api/predict": (
+        "adversarial_ml",
+        lambda body: {"drawn_coords": body["points"]},
+        lambda output: {"prediction": output},
+    ),
+    "/coordinates": (
+        "polysemantic",
+        lambda body: {"guess": body["word"]},
+        lambda output: {"coordinates": [output["projection"][0], output["projection"][1]], "scalar": output["feature_activation"]},
+    ),
+    "/api/steer": (
+        "surgery_sim",
+        steer_inputs,
+        lambda output: output,
+    ),
+}
+
+def generate_inputs(body):
+    return {**steer_inputs(body), "prompt": body["prompt"], **{k: body[k] for k in ("max_new_tokens", "temperature") if k in body}}
+
+# path -> (game, request body to stream inputs); answered as a chunked text/plain stream
+STREAM_ROUTES = {
+    "/api/generate": ("surgery_sim", generate_inputs),
+}
+
+STATUS_TEXT = {200: "OK", 204: "No Content", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+class Gateway:
+    def __init__(self, workers):
+        self.workers = workers
+
+    async def handle(self, method, path, body):
+        """Status and response for one request: a JSON-serializable object, or text for /metrics."""
+        if method == "GET" and path == "/stats":
+            return 200, {name: worker.stats() for name, worker in self.workers.items()}
+        if method == "GET" and path == "/metrics":
+            # every game ships the same instrumentation module, so the first import serves them all
+            instrumentation = sys.modules.get("instrumentation")
+            return 200, "" if instrumentation is None else instrumentation.METRICS.prometheus()
+        if method == "POST" and path in STREAM_ROUTES and STREAM_ROUTES[path][0] in self.workers:
+            return self.handle_stream(path, body)
+        if method != "POST" or path not in ROUTES or ROUTES[path][0] not in self.workers:
+            return 404, {"error": f"No route for {method} {path}"}
+        game, to_inputs, to_response = ROUTES[path]
+        try:
+            inputs = to_inputs(json.loads(body or b"{}"))
+        except (ValueError, KeyError, TypeError) as e:
+            return 400, {"error": f"Bad request: {e}"}
+        try:
+            output = await self.workers[game].submit(inputs)
+        except QueueFull:
+            return 503, {"error": "Model busy."}
+        except Exception as e:
+            print(f"{game} prediction failed: {e!r}")
+            return 500, {"error": "Prediction failed."}
+        return 200, to_response(output)
+
+    def handle_stream(self, path, body):
+        """Status and, on success, an async iterator of text chunks for one streaming request."""
+        game, to_inputs = STREAM_ROUTES[path]
+        try:
+            inputs = to_inputs(json.loads(body or b"{}"))
+        except (ValueError, KeyError, TypeError) as e:
+            return 400, {"error": f"Bad request: {e}"}
+        try:
+            return 200, self.workers[game].submit_stream(inputs)
+        except QueueFull:
+            return 503, {"error": "Model busy."}
+
+    async def write_stream(self, writer, chunks):
+        """Writes chunks as a chunked HTTP body; a failure mid-stream ends the body early and is logged."""
+        try:
+            async for chunk in chunks:
+                data = chunk.encode()
+                if data:
+                    writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+                    await writer.drain()
+        except Exception as e:
+            print(f"Streaming failed: {e!r}")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def serve_connection(self, reader, writer):
+        """Minimal HTTP/1.1 with keep-alive: JSON bodies with Content-Length, CORS open like the Express server."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                if method == "OPTIONS":
+                    status, response = 204, None
+                else:
+                    status, response = await self.handle(method, target.split("?", 1)[0], body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                if hasattr(response, "__aiter__"):
+                    writer.write(
+                        f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                        "Content-Type: text/plain; charset=utf-8\r\n"
+                        "Access-Control-Allow-Origin: *\r\n"
+                        "Transfer-Encoding: chunked\r\n"
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1")
+                    )
+                    await self.write_stream(writer, response)
+                    if not keep_alive:
+                        break
+                    continue
+                content_type = "text/plain; version=0.0.4" if isinstance(response, str) else "application/json"
+                payload = b"" if response is None else (response if isinstance(response, str) else json.dumps(response)).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    "Access-Control-Allow-Origin: *\r\n"
+                    "Access-Control-Allow-Headers: Content-Type\r\n"
+                    "Access-Control-Allow-Methods: GET, POST, OPTIONS\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + payload
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+async def main(args):
+    workers = {}
+    for game in args.games:
+        start = time.perf_counter()
+        workers[game] = ModelWorker(game, load_predictor(game), args.queue_size)
+        print(f"Loaded {game} in {time.perf_counter() - start:.1f}s")
+    tasks = [asyncio.create_task(worker.run()) for worker in workers.values()]
+
+    gateway = Gateway(workers)
+    server = await asyncio.start_server(gateway.serve_connection, args.host, args.port)
+    print(f"Gateway listening at http://{args.host}:{args.port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+if __name__ == "__main__":
+    asyncio.run(main(get_args()))